@@ -1,10 +1,12 @@
+import math
 import random
 from ucb import main, interact, trace
-from collections import OrderedDict
+from collections import Counter, OrderedDict, namedtuple
 
 class Place:
     """A Place holds insects and has an exit to another Place."""
     is_hive = False
+    version = 0  # Goes up whenever the contents change; views compare it with the last seen
 
     def __init__(self, name, exit=None):
         self.name = name
@@ -21,6 +23,7 @@ class Place:
             it can be enhanced in subclasses.
         """
         insect.add_to(self)
+        self.version += 1
 
     def remove_insect(self, insect):
         """
@@ -28,6 +31,32 @@ class Place:
             it can be enhanced in subclasses.
         """
         insect.remove_from(self)
+        self.version += 1
+
+    def damage_bees(self, amount, bees=None):
+        """Reduces the health of each of BEES (all the bees here by default)
+        by AMOUNT, with the same outcome as calling reduce_health(AMOUNT) on
+        each. Bees that expire get their death callbacks together and are
+        removed in one pass over the bee list. Bees no longer here are skipped.
+        """
+        bees = self.bees[:] if bees is None else [bee for bee in bees if bee.place is self]
+        expired = []
+        for bee in bees:
+            if type(bee).reduce_health is not _plain_reduce_health:
+                bee.reduce_health(amount)  # Overridden, as by Boss or Swarm
+                continue
+            bee.health -= amount
+            if bee.health <= 0:
+                expired.append(bee)
+        if bees:
+            self.version += 1
+        for bee in expired:
+            bee.death_callback()
+        if expired:
+            gone = set(map(id, expired))
+            self.bees[:] = [bee for bee in self.bees if id(bee) not in gone]
+            for bee in expired:
+                Insect.remove_from(bee, self)
 
     def __str__(self):
         return self.name
@@ -54,6 +83,8 @@ class Insect:
         3
         """
         self.health -= amount
+        if self.place is not None:
+            self.place.version += 1
         if self.health <= 0:
             self.death_callback()
             self.place.remove_insect(self)
@@ -81,6 +112,8 @@ class Insect:
         cname = type(self).__name__
         return '{0}({1}, {2})'.format(cname, self.health, self.place)
 
+_plain_reduce_health = Insect.reduce_health
+
 
 class Ant(Insect):
     """An Ant occupies a place and does work for the colony."""
@@ -171,8 +204,13 @@ class ThrowerAnt(Ant):
     def throw_at(self, target):
         """Throws a leaf at the TARGET Bee, reducing its health."""
         if target is not None:
+            self.throw_callback(target)
             target.reduce_health(self.damage)
 
+    def throw_callback(self, target):
+        # overriden by the gui
+        pass
+
     def action(self, gamestate):
         """Throws a leaf at the nearest Bee in range."""
         self.throw_at(self.nearest_bee())
@@ -180,6 +218,8 @@ class ThrowerAnt(Ant):
 def random_bee(bees):
     """Returns a random bee from a list of bees, or return None if bees is empty."""
     assert isinstance(bees, list), "random_bee's argument should be a list but was a %s" % type(bees).__name__
+    if any(isinstance(bee, Swarm) for bee in bees):
+        return Swarm.pick(bees)
     if bees:
         return random.choice(bees)
 
@@ -216,15 +256,10 @@ class FireAnt(Ant):
         has no health remaining.
         """
 
-        for bee in self.place.bees[:]:
-            bee.reduce_health(amount)
-        
+        self.place.damage_bees(amount)
         if self.health <= amount:
-            for bee in self.place.bees[:]:
-                bee.reduce_health(self.damage)
-            super().reduce_health(amount)
-        else:
-            super().reduce_health(amount)
+            self.place.damage_bees(self.damage)
+        super().reduce_health(amount)
 
 
 class WallAnt(Ant):
@@ -319,8 +354,7 @@ class TankAnt(ContainerAnt):
     def action(self, gamestate):
         copy_bees = list(self.place.bees)
         super().action(gamestate)
-        for bee in copy_bees:
-            bee.reduce_health(self.damage)
+        self.place.damage_bees(self.damage, copy_bees)
 
 
 class Water(Place):
@@ -398,6 +432,12 @@ class Bee(Insect):
         self.place = place 
         self.is_waterproof = True
 
+    count = 1  # The number of bees this stands for; see Swarm
+
+    @property
+    def total_health(self):
+        return self.health
+
     def sting(self, ant):
         """Attack an ANT, reducing its health by 1."""
         ant.reduce_health(self.damage)
@@ -431,14 +471,6 @@ class Bee(Insect):
         place.bees.remove(self)
         Insect.remove_from(self, place)
 
-    def action(self, gamestate):
-        insects_and_distances = self.insects_in_front()
-        for insect, distance in insects_and_distances.items():
-            damage = self.calculate_damage(distance)
-            insect.reduce_health(damage)
-            if damage:
-                self.insects_shot += 1
-
 
 class Wasp(Bee):
     """Class of Bee that has higher damage."""
@@ -485,6 +517,148 @@ class Boss(Wasp, Hornet):
     def damage_modifier(self, amount):
         return amount * self.damage_cap/(self.damage_cap + amount)
 
+class Swarm(Bee):
+    """Identical bees that share a place, kept as a count of bees per health
+    value. Stings and moves of all its bees are resolved together, and
+    damage to the swarm (from FireAnt or TankAnt) hits every bee in it.
+    A bee is split out as a separate Bee only when it is picked by
+    random_bee.
+
+    Bees act one round at a time: in each round every bee either stings
+    the ant blocking it or moves. The bees that move are the healthiest.
+    """
+
+    def __init__(self, kind, healths, gamestate):
+        self.kind = kind
+        self.name = kind.name
+        self.damage = kind.damage
+        self.healths = Counter(healths)  # health -> number of bees
+        self.gamestate = gamestate
+        self.place = None
+        self.is_waterproof = True
+        self._update()
+
+    @property
+    def count(self):
+        return sum(self.healths.values())
+
+    @property
+    def total_health(self):
+        return sum(health * n for health, n in self.healths.items())
+
+    def _update(self):
+        self.health = max(self.healths) if self.healths else 0
+        if self.place is not None:
+            self.place.version += 1
+
+    def absorb(self, bee):
+        """Adds a Bee, or the bees of another Swarm, to this swarm."""
+        if isinstance(bee, Swarm):
+            self.healths.update(bee.healths)
+        else:
+            self.healths[bee.health] += 1
+        self._update()
+
+    def _take(self, n):
+        """Removes the N healthiest bees and returns their healths."""
+        taken = []
+        for health in sorted(self.healths, reverse=True):
+            k = min(n - len(taken), self.healths[health])
+            taken.extend([health] * k)
+            self.healths[health] -= k
+            if not self.healths[health]:
+                del self.healths[health]
+            if len(taken) == n:
+                break
+        self._update()
+        return taken
+
+    def split(self, index):
+        """Splits out the bee at INDEX in order of health as its own Bee."""
+        for health in sorted(self.healths):
+            if index < self.healths[health]:
+                break
+            index -= self.healths[health]
+        self.healths[health] -= 1
+        if not self.healths[health]:
+            del self.healths[health]
+        self._update()
+        bee = self.kind(health)
+        place = self.place
+        if not self.healths:
+            place.remove_insect(self)
+        place.add_insect(bee)
+        self.gamestate.active_bees.append(bee)
+        return bee
+
+    @staticmethod
+    def pick(bees):
+        """Chooses uniformly among the individual bees in BEES, counting each
+        member of a swarm, and splits the choice out if it is in a swarm.
+        """
+        index = random.randrange(sum(bee.count if isinstance(bee, Swarm) else 1
+                                     for bee in bees))
+        for bee in bees:
+            size = bee.count if isinstance(bee, Swarm) else 1
+            if index < size:
+                return bee.split(index) if isinstance(bee, Swarm) else bee
+            index -= size
+
+    def blocked(self):
+        return self.kind.blocked(self)
+
+    def reduce_health(self, amount):
+        """Reduces the health of every bee in the swarm by AMOUNT."""
+        if not self.healths:
+            return  # Emptied by split
+        healths = Counter()
+        for health, n in self.healths.items():
+            if health - amount > 0:
+                healths[health - amount] += n
+        self.healths = healths
+        self._update()
+        if not healths:
+            self.death_callback()
+            self.place.remove_insect(self)
+
+    def action(self, gamestate):
+        rounds = 2 if self.kind.action is Hornet.action else 1
+        groups = [self]
+        for _ in range(rounds):
+            groups = [g for group in groups if group.health > 0
+                      for g in group._act_once()]
+
+    def _act_once(self):
+        """One round: bees sting until the way is clear, then the rest move.
+        Returns the swarms that are still on the board.
+        """
+        stung = 0
+        while self.health > 0 and stung < self.count and self.blocked():
+            ant = self.place.ant
+            stings = 1
+            if type(ant).reduce_health is Insect.reduce_health:
+                # No reaction to each sting, so the stings up to the one that
+                # kills this ant can land at once
+                stings = min(self.count - stung, math.ceil(ant.health / self.damage))
+            ant.reduce_health(self.damage * stings)
+            stung += stings
+        moving = self.count - stung
+        destination = self.place.exit if self.place else None
+        if moving <= 0 or destination is None:
+            return [self] if self.health > 0 else []
+        if stung == 0:
+            self.move_to(destination)
+            return [self]
+        moved = Swarm(self.kind, self._take(moving), self.gamestate)
+        self.gamestate.active_bees.append(moved)
+        destination.add_insect(moved)
+        return [self, moved]
+
+    def __repr__(self):
+        return '{0}x{1}({2}, {3})'.format(self.name, self.count, self.health, self.place)
+
+SWARM_KINDS = (Bee, Wasp, Hornet, NinjaBee)
+
 class Hive(Place):
     """The Place from which the Bees launch their assault.
 
@@ -518,7 +692,9 @@ class GameState:
     food -- the colony's available food total
     places -- A list of all places in the colony (including a Hive)
     bee_entrances -- A list of places that bees can enter
+    swarms -- whether identical bees sharing a place are merged into Swarms
     """
+    swarms = False
 
     def __init__(self, strategy, beehive, ant_types, create_places, dimensions, food=2):
         """Creates a GameState for simulating a game.
@@ -537,6 +713,8 @@ class GameState:
         self.ant_types = OrderedDict((a.name, a) for a in ant_types)
         self.dimensions = dimensions
         self.active_bees = []
+        self.outcome = None
+        self.turn_start = None
         self.configure(beehive, create_places)
 
     def configure(self, beehive, create_places):
@@ -551,32 +729,110 @@ class GameState:
                 self.bee_entrances.append(place)
         register_place(self.beehive, False)
         create_places(self.base, register_place, self.dimensions[0], self.dimensions[1])
+        self.tunnel_places = []  # (tunnel index, place) pairs
+        for tunnel, place in enumerate(self.bee_entrances):
+            while place is not self.base:
+                self.tunnel_places.append((tunnel, place))
+                place = place.exit
 
     def simulate(self):
         """Simulates an attack on the ant colony (i.e., play the game)."""
-        num_bees = len(self.bees)
+        for record in self.turns():
+            pass
+        if self.outcome:
+            print('All bees are vanquished. You win!')
+        else:
+            print('The ant queen has perished. Please try again.')
+        return self.outcome
+
+    def turns(self):
+        """Plays the game, yielding a TurnRecord after every turn."""
+        while self.outcome is None:
+            yield self.step()
+
+    def step(self):
+        """Plays one turn and returns its TurnRecord. When the game ends
+        during the turn, outcome becomes True (ants win) or False.
+        """
+        assert self.outcome is None, 'The game is over'
         try:
-            while True:
-                self.beehive.strategy(self)         # Bees invade
-                self.strategy(self)                 # Ants deploy
-                for ant in self.ants:               # Ants take actions
-                    if ant.health > 0:
-                        ant.action(self)
-                for bee in self.active_bees[:]:     # Bees take actions
-                    if bee.health > 0:
-                        bee.action(self)
-                    if bee.health <= 0:
-                        num_bees -= 1
-                        self.active_bees.remove(bee)
-                if num_bees == 0:
-                    raise AntsWinException()
-                self.time += 1
+            self.beehive.strategy(self)         # Bees invade
+            self.strategy(self)                 # Ants deploy
+            self.take_actions()
         except AntsWinException:
-            print('All bees are vanquished. You win!')
-            return True
+            self.outcome = True
         except AntsLoseException:
-            print('The ant queen has perished. Please try again.')
-            return False
+            self.outcome = False
+        return self.end_turn()
+
+    def take_actions(self):
+        """Ants, then bees, take their actions. Raises AntsWinException once
+        no bees remain.
+        """
+        self.turn_start = self.health_totals()
+        for ant in self.ants:               # Ants take actions
+            if ant.health > 0:
+                ant.action(self)
+        for bee in self.active_bees[:]:     # Bees take actions
+            if bee.health > 0:
+                bee.action(self)
+            if bee.health <= 0:
+                self.active_bees.remove(bee)
+        if self.swarms:
+            self.gather_swarms()
+        if not self.active_bees and not self.beehive.bees:
+            raise AntsWinException()
+
+    def end_turn(self):
+        """Returns the TurnRecord of the turn and advances time if the game
+        goes on.
+        """
+        ant_health, bee_health = self.health_totals()
+        start_ant_health, start_bee_health = self.turn_start or (ant_health, bee_health)
+        self.turn_start = None
+        bees = [0] * len(self.bee_entrances)
+        for tunnel, place in self.tunnel_places:
+            for bee in place.bees:
+                bees[tunnel] += bee.count
+        record = TurnRecord(self.time, self.food, len(self.ants_alive), tuple(bees),
+                            start_bee_health - bee_health, start_ant_health - ant_health,
+                            self.outcome)
+        if self.outcome is None:
+            self.time += 1
+        return record
+
+    def health_totals(self):
+        """The total health of the ants and of the active bees."""
+        ant_health = sum(ant.health for ant in self.ants_alive)
+        bee_health = sum(bee.total_health for bee in self.active_bees if bee.health > 0)
+        return ant_health, bee_health
+
+    def gather_swarms(self):
+        """Merges bees of the same kind that share a place into one Swarm."""
+        gathered = set()
+        for place in self.places.values():
+            if place.is_hive or len(place.bees) < 2:
+                continue
+            kinds = OrderedDict()
+            for bee in place.bees:
+                kind = bee.kind if isinstance(bee, Swarm) else type(bee)
+                if kind in SWARM_KINDS:
+                    kinds.setdefault(kind, []).append(bee)
+            for kind, bees in kinds.items():
+                if len(bees) < 2:
+                    continue
+                swarm = next((bee for bee in bees if isinstance(bee, Swarm)), None)
+                if swarm is None:
+                    swarm = Swarm(kind, [], self)
+                    place.add_insect(swarm)
+                    self.active_bees.append(swarm)
+                for bee in bees:
+                    if bee is not swarm:
+                        swarm.absorb(bee)
+                        place.remove_insect(bee)
+                        gathered.add(bee)
+        if gathered:
+            self.active_bees = [bee for bee in self.active_bees if bee not in gathered]
 
     def deploy_ant(self, place_name, ant_type_name):
         """Places an ant if enough food is available.
@@ -608,6 +864,13 @@ class GameState:
     def ants(self):
         return [p.ant for p in self.places.values() if p.ant is not None]
 
+    @property
+    def ants_alive(self):
+        """All ants on the board, including contained ants."""
+        ants = self.ants
+        return ants + [ant.ant_contained for ant in ants
+                       if getattr(ant, 'ant_contained', None) is not None]
+
     @property
     def bees(self):
         return [b for p in self.places.values() for b in p.bees]
@@ -620,6 +883,11 @@ class GameState:
         status = ' (Food: {0}, Time: {1})'.format(self.food, self.time)
         return str([str(i) for i in self.ants + self.bees]) + status
 
+TurnRecord = namedtuple('TurnRecord', 'time food ants bees damage_dealt damage_taken outcome')
+TurnRecord.__doc__ = """What happened in one turn: the food left, the ants alive, the bees
+alive in each tunnel, the damage dealt to bees and taken by ants, and the
+outcome (True or False if the game ended in this turn, otherwise None)."""
+
 class AntHomeBase(Place):
     """AntHomeBase at the end of the tunnel, where the queen resides."""
 
@@ -0,0 +1,172 @@
+"""Plays games with async strategies, many at once on one event loop.
+
+An async strategy is written as async def strategy(gamestate). It may await
+anything, such as a model server, but it must finish within the turn's
+deadline. The gamestate it receives is a TurnOrders view. Its deploy_ant
+and remove_ant calls are queued, and they take effect only if the strategy
+returns in time. A strategy that misses the deadline is cancelled and
+forfeits that turn's deployments.
+"""
+
+import asyncio
+import random
+import time
+import ants
+from ucb import main
+from ants_plans import make_normal_assault_plan
+
+STRATEGY_DEADLINE = 0.5  # Seconds per turn
+
+class TurnOrders:
+    """One turn's view of a GameState for an async strategy.
+
+    Attributes are read from the game. deploy_ant checks food against what
+    earlier orders this turn have already spent.
+    """
+
+    def __init__(self, gamestate):
+        self.gamestate = gamestate
+        self.food = gamestate.food
+        self.orders = []  # (place name, ant type name or None to remove)
+
+    def __getattr__(self, name):
+        return getattr(self.gamestate, name)
+
+    def deploy_ant(self, place_name, ant_type_name):
+        constructor = self.gamestate.ant_types[ant_type_name]
+        if self.food < constructor.food_cost:
+            raise ants.NotEnoughFoodException()
+        self.food -= constructor.food_cost
+        self.orders.append((place_name, ant_type_name))
+
+    def remove_ant(self, place_name):
+        self.orders.append((place_name, None))
+
+    def apply(self):
+        """Carries out the orders, skipping any the board no longer allows."""
+        for place_name, ant_type_name in self.orders:
+            if ant_type_name is None:
+                self.gamestate.remove_ant(place_name)
+                continue
+            try:
+                self.gamestate.deploy_ant(place_name, ant_type_name)
+            except AssertionError as e:
+                print('Order to place {0} rejected: {1}'.format(ant_type_name, e))
+
+
+class _OwnRandom:
+    """Swaps a game's own random state in while its synchronous code runs,
+    so interleaved games on one loop stay reproducible.
+    """
+
+    def __init__(self, seed):
+        self.state = None
+        if seed is not None:
+            saved = random.getstate()
+            random.seed(seed)
+            self.state = random.getstate()
+            random.setstate(saved)
+
+    def __enter__(self):
+        if self.state is not None:
+            self.saved = random.getstate()
+            random.setstate(self.state)
+
+    def __exit__(self, *exc):
+        if self.state is not None:
+            self.state = random.getstate()
+            random.setstate(self.saved)
+
+
+async def turns(gamestate, strategy, deadline=STRATEGY_DEADLINE, seed=None):
+    """Plays GAMESTATE with the async STRATEGY, yielding a TurnRecord after
+    every turn. The times of forfeited turns are kept in gamestate.forfeited.
+    """
+    own_random = _OwnRandom(seed)
+    gamestate.forfeited = []
+    while gamestate.outcome is None:
+        orders = TurnOrders(gamestate)
+        try:
+            with own_random:
+                gamestate.beehive.strategy(gamestate)     # Bees invade
+            try:
+                await asyncio.wait_for(strategy(orders), deadline)
+            except asyncio.TimeoutError:
+                gamestate.forfeited.append(gamestate.time)
+            else:
+                orders.apply()                            # Ants deploy
+            with own_random:
+                gamestate.take_actions()
+        except ants.AntsWinException:
+            gamestate.outcome = True
+        except ants.AntsLoseException:
+            gamestate.outcome = False
+        yield gamestate.end_turn()
+
+async def play(gamestate, strategy, deadline=STRATEGY_DEADLINE, seed=None):
+    """Plays GAMESTATE to the end and returns True if the ants win."""
+    async for record in turns(gamestate, strategy, deadline, seed):
+        pass
+    return gamestate.outcome
+
+
+class Evaluator:
+    """A stand-in for a local model server: scores candidate placements
+    after a random delay of around LATENCY seconds.
+    """
+
+    def __init__(self, latency=0.01, seed=None):
+        self.latency = latency
+        self.rng = random.Random(seed)  # Leaves the games' random state alone
+
+    async def score(self, gamestate, place_names):
+        await asyncio.sleep(self.rng.expovariate(1 / self.latency))
+        # Places nearer the hive score higher
+        return [self.rng.random() + int(name.split('_')[-1]) / 10 for name in place_names]
+
+def evaluator_strategy(evaluator):
+    """An async strategy that asks EVALUATOR where to place the next ant: a
+    Harvester while there are fewer than one per tunnel, then Throwers.
+    """
+    async def strategy(gamestate):
+        harvesters = sum(ant.name == 'Harvester' for ant in gamestate.ants)
+        name = 'Harvester' if harvesters < len(gamestate.bee_entrances) else 'Thrower'
+        if gamestate.food < gamestate.ant_types[name].food_cost:
+            return
+        free = [place.name for place in gamestate.places.values()
+                if not place.is_hive and place.ant is None and not isinstance(place, ants.Water)]
+        if not free:
+            return
+        scores = await evaluator.score(gamestate, free)
+        if name == 'Harvester':
+            scores = [-score for score in scores]  # Keep harvesters at the back
+        gamestate.deploy_ant(max(zip(scores, free))[1], name)
+    return strategy
+
+
+async def play_many(games, deadline=STRATEGY_DEADLINE):
+    """Plays (gamestate, strategy, seed) GAMES concurrently and returns
+    their outcomes.
+    """
+    return await asyncio.gather(*[play(gamestate, strategy, deadline, seed)
+                                  for gamestate, strategy, seed in games])
+
+def new_game(make_plan=make_normal_assault_plan, layout=ants.wet_layout,
+             dimensions=(3, 10), food=2):
+    beehive = ants.Hive(make_plan(ants))
+    return ants.GameState(None, beehive, ants.ant_types(), layout, dimensions, food)
+
+@main
+def run(*args):
+    """Plays N games (default 100) against a stand-in evaluator."""
+    import contextlib, io
+    n = int(args[0]) if args else 100
+    deadline = float(args[1]) if len(args) > 1 else STRATEGY_DEADLINE
+    evaluator = Evaluator(seed=0)
+    games = [(new_game(), evaluator_strategy(evaluator), seed) for seed in range(n)]
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        outcomes = asyncio.run(play_many(games, deadline))
+    forfeited = sum(len(gamestate.forfeited) for gamestate, _, _ in games)
+    print('{0} games in {1:.2f}s: {2} won, {3} turns forfeited'.format(
+        n, time.time() - start, sum(outcomes), forfeited))
@@ -0,0 +1,303 @@
+"""Spreads a batch of games over worker processes on any number of hosts.
+
+The coordinator splits the (plan, layout, strategy, seed) jobs into chunks
+and listens on a TCP address (host:port) or a Unix socket (a path). A
+worker connects, asks for a chunk, plays its games headlessly and sends
+back each game's row as soon as it ends, then asks for another chunk.
+
+Each message is a JSON object, sent as its length in 4 big-endian bytes
+followed by the JSON text:
+
+    worker -> coordinator  {"type": "ready"}
+                           {"type": "row", "index": i, "row": {...}}
+                           {"type": "error", "index": i, "error": "..."}
+    coordinator -> worker  {"type": "chunk", "jobs": [[i, plan, layout, strategy, seed], ...]}
+                           {"type": "done"}
+
+A worker that disconnects, or sends nothing for TIMEOUT seconds, is
+dropped. The games of its chunk that it had not reported go back on the
+queue, and after MAX_ATTEMPTS such losses a game is given up on. A game
+that raises an error is not retried, since it would raise again. Rows are
+appended to a ResultStore as they arrive, and a progress line shows the
+games done, the rate, the workers connected and the games retried.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+from collections import Counter, deque
+from ucb import main
+from ants_store import (PLAN_NAMES, LAYOUT_NAMES, STRATEGY_NAMES, ResultStore,
+                        play_game)
+
+CHUNK = 50
+TIMEOUT = 60          # Seconds a worker may go without sending anything
+MAX_ATTEMPTS = 3      # Times a game may be lost with its worker
+PROGRESS = 1          # Seconds between progress lines
+CONNECT_TIMEOUT = 30  # Seconds a worker keeps trying to reach the coordinator
+HEADER = struct.Struct('>I')
+
+def parse_address(text):
+    """'host:port' -> (host, port) for TCP; anything else is a Unix socket path."""
+    host, _, port = text.rpartition(':')
+    if host and port.isdigit() and '/' not in text:
+        return host, int(port)
+    return text
+
+def encode(message):
+    data = json.dumps(message).encode()
+    return HEADER.pack(len(data)) + data
+
+
+class Coordinator:
+    """Hands out chunks of JOBS and collects a row for each job.
+
+    sink -- called with (job, row) for each job's first row
+    """
+
+    def __init__(self, jobs, chunk=CHUNK, sink=None, timeout=TIMEOUT,
+                 max_attempts=MAX_ATTEMPTS):
+        self.jobs = jobs
+        self.queue = deque(list(range(i, min(i + chunk, len(jobs))))
+                           for i in range(0, len(jobs), chunk))
+        self.sink = sink
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.done = [False] * len(jobs)
+        self.completed = 0
+        self.attempts = [0] * len(jobs)
+        self.failed = {}  # index -> reason
+        self.retried = 0
+        self.workers = 0
+        self.finished = None
+
+    def _check_finished(self):
+        if self.completed + len(self.failed) == len(self.jobs):
+            self.finished.set()
+
+    def _requeue(self, outstanding, reason):
+        """Puts the unreported jobs of a lost chunk back on the queue."""
+        retry = []
+        for index in sorted(outstanding):
+            if self.done[index] or index in self.failed:
+                continue
+            self.attempts[index] += 1
+            if self.attempts[index] >= self.max_attempts:
+                self.failed[index] = reason
+            else:
+                retry.append(index)
+        outstanding.clear()
+        if retry:
+            self.queue.appendleft(retry)
+            self.retried += len(retry)
+        self._check_finished()
+
+    def _record(self, outstanding, message):
+        index = message['index']
+        outstanding.discard(index)
+        if self.done[index] or index in self.failed:
+            return
+        if message['type'] == 'error':
+            self.failed[index] = message['error']
+        else:
+            self.done[index] = True
+            self.completed += 1
+            if self.sink:
+                self.sink(self.jobs[index], message['row'])
+        self._check_finished()
+
+    async def _next_chunk(self):
+        """The next chunk, waiting while other workers' chunks may yet be
+        lost, or None once every job is settled.
+        """
+        while not self.queue:
+            if self.finished.is_set():
+                return None
+            await asyncio.sleep(0.1)
+        return self.queue.popleft()
+
+    async def _handle(self, reader, writer):
+        outstanding = set()
+        self.workers += 1
+        try:
+            while True:
+                header = await asyncio.wait_for(reader.readexactly(HEADER.size), self.timeout)
+                data = await asyncio.wait_for(
+                    reader.readexactly(HEADER.unpack(header)[0]), self.timeout)
+                message = json.loads(data)
+                if message['type'] != 'ready':
+                    self._record(outstanding, message)
+                    continue
+                self._requeue(outstanding, 'skipped by its worker')
+                chunk = await self._next_chunk()
+                if chunk is None:
+                    writer.write(encode({'type': 'done'}))
+                    await writer.drain()
+                    return
+                outstanding.update(chunk)
+                writer.write(encode({'type': 'chunk',
+                                     'jobs': [[i] + list(self.jobs[i]) for i in chunk]}))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError,
+                ValueError, KeyError):
+            pass  # The worker died, hung or spoke nonsense
+        finally:
+            self.workers -= 1
+            self._requeue(outstanding, 'lost with its worker')
+            writer.close()
+
+    async def _progress(self):
+        start = time.time()
+        while True:
+            elapsed = time.time() - start
+            print('\r{0}/{1} games, {2:.1f}/s, {3} workers, {4} retried, {5} failed   '.format(
+                self.completed, len(self.jobs), self.completed / max(elapsed, 1e-9),
+                self.workers, self.retried, len(self.failed)), end='', flush=True)
+            if self.finished.is_set():
+                print()
+                return
+            try:
+                await asyncio.wait_for(asyncio.shield(self.finished.wait()), PROGRESS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def serve(self, address, started=None, progress=True):
+        """Serves jobs at ADDRESS until every job has a row or has failed.
+        STARTED is called with the address being listened on.
+        """
+        self.finished = asyncio.Event()
+        self._check_finished()
+        address = parse_address(address)
+        if isinstance(address, tuple):
+            server = await asyncio.start_server(self._handle, *address)
+            host, port = server.sockets[0].getsockname()[:2]
+            listening = '{0}:{1}'.format(host, port)
+        else:
+            server = await asyncio.start_unix_server(self._handle, address)
+            listening = address
+        if started:
+            started(listening)
+        reporter = asyncio.ensure_future(self._progress()) if progress else None
+        async with server:
+            await self.finished.wait()
+            if reporter:
+                await reporter
+            while self.workers:  # Let idle workers hear that there is nothing left
+                await asyncio.sleep(0.05)
+        if not isinstance(address, tuple) and os.path.exists(address):
+            os.unlink(address)
+
+
+def receive(f):
+    """The next message from file F, or None at the end of the stream."""
+    header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    return json.loads(f.read(HEADER.unpack(header)[0]))
+
+def connect(address, timeout=CONNECT_TIMEOUT):
+    """A socket connected to the coordinator, retrying until TIMEOUT."""
+    address = parse_address(address)
+    deadline = time.time() + timeout
+    while True:
+        try:
+            if isinstance(address, tuple):
+                return socket.create_connection(address)
+            sock = socket.socket(socket.AF_UNIX)
+            sock.connect(address)
+            return sock
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.5)
+
+def work(address, die_after=None):
+    """Plays chunks from the coordinator at ADDRESS until it has none left.
+    Returns the number of games played. With DIE_AFTER, exits abruptly after
+    that many games, as a crashed worker would.
+    """
+    played = 0
+    with connect(address) as sock, sock.makefile('rb') as f:
+        while True:
+            sock.sendall(encode({'type': 'ready'}))
+            message = receive(f)
+            if message is None or message['type'] == 'done':
+                return played
+            for index, *job in message['jobs']:
+                try:
+                    reply = {'type': 'row', 'index': index, 'row': play_game(tuple(job))}
+                except Exception as e:
+                    reply = {'type': 'error', 'index': index, 'error': repr(e)}
+                sock.sendall(encode(reply))
+                played += 1
+                if die_after is not None and played >= die_after:
+                    os._exit(1)
+
+
+@main
+def run(*args):
+    import argparse
+    parser = argparse.ArgumentParser(description='Distributed game batches for Ants vs. SomeBees')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help='split jobs into chunks and hand them out')
+    serve.add_argument('address', nargs='?', default='127.0.0.1:0',
+                       help='host:port, or a Unix socket path (default: any free local port)')
+    serve.add_argument('--seeds', type=int, default=20, help='seeds of each plan, layout and strategy')
+    serve.add_argument('--plans', default=','.join(PLAN_NAMES[:3]))
+    serve.add_argument('--layouts', default=','.join(LAYOUT_NAMES))
+    serve.add_argument('--strategies', default=','.join(STRATEGY_NAMES))
+    serve.add_argument('--chunk', type=int, default=CHUNK, help='games per chunk')
+    serve.add_argument('--timeout', type=float, default=TIMEOUT,
+                       help='seconds of silence before a worker is dropped')
+    serve.add_argument('--store', help='append rows to this ResultStore directory')
+    serve.add_argument('--local-workers', type=int, default=0,
+                       help='start this many worker processes on this host')
+    serve.add_argument('--die-after', type=int,
+                       help='make the first local worker crash after this many games')
+    worker = commands.add_parser('work', help='play chunks for a coordinator')
+    worker.add_argument('address', help='the coordinator\'s host:port or Unix socket path')
+    worker.add_argument('--die-after', type=int, help='crash after this many games')
+    args = parser.parse_args()
+    if args.command == 'work':
+        try:
+            print('Played {0} games'.format(work(args.address, args.die_after)))
+        except ConnectionError as e:
+            print('Lost the coordinator: ' + str(e))
+        return
+    jobs = [(plan, layout, strategy, seed) for plan in args.plans.split(',')
+            for layout in args.layouts.split(',')
+            for strategy in args.strategies.split(',') for seed in range(args.seeds)]
+    writer = ResultStore(args.store).writer() if args.store else None
+    wins, games = Counter(), Counter()
+    def sink(job, row):
+        games[job[0], job[2]] += 1
+        wins[job[0], job[2]] += row['winner'] == 1
+        if writer:
+            writer.append(row)
+    coordinator = Coordinator(jobs, args.chunk, sink, args.timeout)
+    processes = []
+    def started(address):
+        print('Serving {0} games on {1}'.format(len(jobs), address))
+        for i in range(args.local_workers):
+            die_after = ['--die-after', str(args.die_after)] if i == 0 and args.die_after else []
+            processes.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), 'work',
+                                               address] + die_after,
+                                              stdout=subprocess.DEVNULL))
+    start = time.time()
+    try:
+        asyncio.run(coordinator.serve(args.address, started))
+    finally:
+        if writer:
+            writer.close()
+        for process in processes:
+            process.wait()
+    print('{0} games in {1:.1f}s'.format(coordinator.completed, time.time() - start))
+    for (plan, strategy), n in sorted(games.items()):
+        print('{0:<10} {1:<20} {2:.2f} won of {3}'.format(plan, strategy, wins[plan, strategy] / n, n))
+    for index, reason in sorted(coordinator.failed.items()):
+        print('Failed: {0} ({1})'.format(jobs[index], reason))
@@ -0,0 +1,207 @@
+"""A reset/step environment around GameState for training deployment policies.
+
+Actions are integers: 0 does nothing, then one action per (ant type, place)
+deploys that ant there, then one action per place removes its ant.
+Observations are NumPy arrays that are filled in place every step.
+"""
+
+import random
+import ants
+from ants_plans import make_normal_assault_plan
+
+try:
+    import numpy as np
+except Exception as e:
+    print('Could not load numpy: ' + str(e))
+
+# Channels of the per-place observation
+ANT_TYPE, ANT_HEALTH, BEE_COUNT, BEE_HEALTH, WATER = range(5)
+NUM_CHANNELS = 5
+FOOD, TIME = range(2)
+
+class AntsEnv:
+    """A single game of Ants that advances one turn per step.
+
+    make_plan -- a function that takes the ants module and returns an AssaultPlan
+    layout -- a layout function such as ants.dry_layout
+    dimensions -- a (tunnels, length) pair
+    food -- the food the colony starts with
+    buffers -- optional (places, globals) arrays to fill with observations
+    """
+
+    def __init__(self, make_plan=make_normal_assault_plan, layout=ants.dry_layout,
+                 dimensions=(3, 10), food=2, buffers=None):
+        self.make_plan = make_plan
+        self.layout = layout
+        self.dimensions = dimensions
+        self.start_food = food
+        self.ant_types = ants.ant_types()
+        self.type_index = {t.name: i + 1 for i, t in enumerate(self.ant_types)}
+        self.gamestate = None
+        self.rng_state = None
+        self.place_names = None
+        self._new_gamestate()
+        self.num_actions = 1 + (len(self.ant_types) + 1) * len(self.place_names)
+        if buffers is None:
+            buffers = (np.zeros((len(self.place_names), NUM_CHANNELS), dtype=np.float32),
+                       np.zeros(2, dtype=np.float32))
+        self.obs_places, self.obs_globals = buffers
+
+    def _new_gamestate(self):
+        beehive = ants.Hive(self.make_plan(ants))
+        self.gamestate = ants.GameState(None, beehive, self.ant_types, self.layout,
+                                        self.dimensions, self.start_food)
+        if self.place_names is None:
+            self.place_names = [name for name, p in self.gamestate.places.items() if not p.is_hive]
+        self.places = [self.gamestate.places[name] for name in self.place_names]
+        self.seen = [-1] * len(self.places)  # Place version each row was written at
+        self.done = False
+
+    def decode(self, action):
+        """Returns ('noop', None, None), ('deploy', type name, place name) or
+        ('remove', None, place name) for an integer ACTION.
+        """
+        if action == 0:
+            return 'noop', None, None
+        action -= 1
+        num_places = len(self.place_names)
+        kind, place = divmod(action, num_places)
+        if kind < len(self.ant_types):
+            return 'deploy', self.ant_types[kind].name, self.place_names[place]
+        return 'remove', None, self.place_names[place]
+
+    def reset(self, seed=None):
+        """Starts a new game and returns its first observation.
+
+        With a SEED, the environment keeps its own random state, so games
+        stepped in lockstep with other environments stay reproducible.
+        """
+        if seed is not None:
+            saved = random.getstate()
+            random.seed(seed)
+        self._new_gamestate()
+        self.obs_places[:] = 0
+        try:
+            self.gamestate.beehive.strategy(self.gamestate)
+        finally:
+            if seed is not None:
+                self.rng_state = random.getstate()
+                random.setstate(saved)
+            else:
+                self.rng_state = None
+        return self.observe()
+
+    def step(self, action):
+        """Applies ACTION as this turn's deployment and runs the rest of the turn.
+
+        Returns (observation, reward, done, info). The reward is 1 when the
+        ants win, -1 when they lose and 0 otherwise. info holds the turn's
+        TurnRecord under 'record'.
+        """
+        assert not self.done, 'step called on a finished game; call reset'
+        if self.rng_state is not None:
+            saved = random.getstate()
+            random.setstate(self.rng_state)
+        info = {'valid': self._apply(action)}
+        gamestate = self.gamestate
+        try:
+            try:
+                gamestate.take_actions()
+            except ants.AntsWinException:
+                gamestate.outcome = True
+            except ants.AntsLoseException:
+                gamestate.outcome = False
+            info['record'] = gamestate.end_turn()
+            if gamestate.outcome is None:
+                gamestate.beehive.strategy(gamestate)
+        finally:
+            if self.rng_state is not None:
+                self.rng_state = random.getstate()
+                random.setstate(saved)
+        self.done = gamestate.outcome is not None
+        reward = {True: 1, False: -1}.get(gamestate.outcome, 0)
+        info['time'] = gamestate.time
+        return self.observe(), reward, self.done, info
+
+    def _apply(self, action):
+        """Performs a decoded action, returning False if it was not allowed."""
+        kind, type_name, place_name = self.decode(action)
+        gamestate = self.gamestate
+        if kind == 'noop':
+            return True
+        place = gamestate.places[place_name]
+        if kind == 'remove':
+            if place.ant is None:
+                return False
+            gamestate.remove_ant(place_name)
+            return True
+        constructor = gamestate.ant_types[type_name]
+        if gamestate.food < constructor.food_cost:
+            return False
+        try:
+            gamestate.deploy_ant(place_name, type_name)
+        except AssertionError:
+            return False  # The place already holds an ant it cannot share with
+        return True
+
+    def observe(self):
+        """Refreshes the observation arrays and returns them as (places, globals).
+
+        Only places whose version changed since the last call are rewritten.
+        """
+        obs = self.obs_places
+        for i, place in enumerate(self.places):
+            if place.version == self.seen[i]:
+                continue
+            self.seen[i] = place.version
+            ant = place.ant
+            if ant is None:
+                obs[i, ANT_TYPE] = obs[i, ANT_HEALTH] = 0
+            else:
+                obs[i, ANT_TYPE] = self.type_index.get(ant.name, 0)
+                obs[i, ANT_HEALTH] = ant.health
+            obs[i, BEE_COUNT] = len(place.bees)
+            obs[i, BEE_HEALTH] = sum(bee.health for bee in place.bees)
+            obs[i, WATER] = isinstance(place, ants.Water)
+        self.obs_globals[FOOD] = self.gamestate.food
+        self.obs_globals[TIME] = self.gamestate.time
+        return self.obs_places, self.obs_globals
+
+
+class VecAntsEnv:
+    """N AntsEnvs stepped in lockstep, observed into shared preallocated arrays.
+
+    Finished games are reset automatically; the step that finished them
+    reports done and reward, and its observation is the new game's first.
+    The arrays returned by reset and step are reused on every call.
+    """
+
+    def __init__(self, n, seed=None, **kwargs):
+        probe = AntsEnv(**kwargs)
+        num_places = len(probe.place_names)
+        self.obs_places = np.zeros((n, num_places, NUM_CHANNELS), dtype=np.float32)
+        self.obs_globals = np.zeros((n, 2), dtype=np.float32)
+        self.rewards = np.zeros(n, dtype=np.float32)
+        self.dones = np.zeros(n, dtype=bool)
+        self.envs = [AntsEnv(buffers=(self.obs_places[i], self.obs_globals[i]), **kwargs)
+                     for i in range(n)]
+        self.num_actions = probe.num_actions
+        self.seed = seed
+        self.games = 0
+
+    def _next_seed(self):
+        self.games += 1
+        return None if self.seed is None else self.seed + self.games
+
+    def reset(self):
+        for env in self.envs:
+            env.reset(self._next_seed())
+        return self.obs_places, self.obs_globals
+
+    def step(self, actions):
+        """Steps env i with ACTIONS[i]. Returns (places, globals, rewards, dones)."""
+        for i, env in enumerate(self.envs):
+            _, self.rewards[i], self.dones[i], _ = env.step(int(actions[i]))
+            if self.dones[i]:
+                env.reset(self._next_seed())
+        return self.obs_places, self.obs_globals, self.rewards, self.dones
@@ -0,0 +1,293 @@
+"""A greedy strategy that places ants where a threat forecast says they help most.
+
+The forecast keeps, for each tunnel, the bees in it (step and health), the
+throwers in it (step, damage and range) and a share of the bees still to
+come in the assault plan. A bee's threat is the health it would have left on
+reaching the base after walking through every thrower's range. Placing a
+thrower lowers the threat of the bees whose path crosses its range; that
+drop per food spent is the ant's marginal value. A Harvester's value is the
+food it will gather before the last wave has crossed the board, spent as
+well as the best defender now, and less while bees on the board are
+still a threat.
+
+Each turn the forecast only looks at what changed: bees that moved, were
+hurt or died, ants that died and waves that left the hive. Only tunnels
+touched by those changes are evaluated again, and each ant type keeps a
+heap of its best placement in every tunnel, so a choice does not scan the
+board.
+"""
+
+import heapq
+import time
+from collections import Counter
+import ants
+from ucb import main
+from ants_plans import PLANS
+
+DEFENDERS = ('Thrower', 'Short', 'Long')
+FUTURE_WEIGHT = 0.25  # Bees still in the hive count for less than bees here
+HARVEST_VALUE = 0.3   # A food of income, per turn left, against a food spent now
+
+class ThreatForecast:
+    """The per-tunnel forecast for one game, updated once per turn."""
+
+    def __init__(self, gamestate):
+        self.tunnels = len(gamestate.bee_entrances)
+        self.length = gamestate.dimensions[1]
+        self.positions = {}  # place -> (tunnel, step)
+        self.places = [[] for _ in range(self.tunnels)]  # Nearest the base first
+        for tunnel, place in gamestate.tunnel_places:
+            self.places[tunnel].insert(0, place)
+        for tunnel, places in enumerate(self.places):
+            for step, place in enumerate(places):
+                self.positions[place] = (tunnel, step)
+        self.defenders = [gamestate.ant_types[name] for name in DEFENDERS
+                          if name in gamestate.ant_types]
+        self.harvester = gamestate.ant_types.get('Harvester')  # None if the game has none
+        plan = gamestate.beehive.assault_plan
+        self.waves = sorted((t, [bee.health for bee in plan[t]]) for t in plan)
+        self.last_wave = self.waves[-1][0] if self.waves else 0
+        self.future = Counter()  # Health -> bees still in the hive
+        for t, healths in self.waves:
+            if t >= gamestate.time:
+                self.future.update(healths)
+        self.future_gains = {}  # Damage window -> _gains for the bees to come
+        self.seen = {}      # bee -> (tunnel, step, health, count) when last seen
+        self.bees = [{} for _ in range(self.tunnels)]      # bee -> (step, health, count)
+        self.throwers = [{} for _ in range(self.tunnels)]  # ant -> (step, damage, lo, hi)
+        self.owned = {}     # ant -> tunnel, for the ants this forecast placed
+        self.placements = 0
+        self.heaps = {name: [] for name in DEFENDERS + ('Harvester',)}
+        self.version = [0] * self.tunnels  # Heap entries of older versions are stale
+        self.threat = [0] * self.tunnels
+        self.urgent = [0] * self.tunnels  # The threat of the bees on the board
+        self.urgent_total = 0
+        self.dirty = set(range(self.tunnels))
+        self.time = gamestate.time
+
+    def update(self, gamestate):
+        """Takes in everything that changed since the last call."""
+        while self.waves and self.waves[0][0] <= gamestate.time:
+            t, healths = self.waves.pop(0)
+            if t >= self.time:
+                self.future.subtract(healths)
+                self.future_gains = {}
+                self.dirty.update(range(self.tunnels))  # Every tunnel's share changed
+        self.time = gamestate.time
+        current = set()
+        for bee in gamestate.active_bees:
+            position = self.positions.get(bee.place)
+            if position is None or bee.health <= 0:
+                continue
+            current.add(bee)
+            tunnel, step = position
+            state = (tunnel, step, bee.health, bee.count)
+            old = self.seen.get(bee)
+            if old == state:
+                continue
+            if old is not None:
+                del self.bees[old[0]][bee]
+                self.dirty.add(old[0])
+            self.seen[bee] = state
+            self.bees[tunnel][bee] = state[1:]
+            self.dirty.add(tunnel)
+        if len(current) != len(self.seen):
+            for bee in [bee for bee in self.seen if bee not in current]:
+                tunnel = self.seen.pop(bee)[0]
+                del self.bees[tunnel][bee]
+                self.dirty.add(tunnel)
+        for ant, tunnel in list(self.owned.items()):
+            if ant.health <= 0 or ant.place is None:
+                del self.owned[ant]
+                self.throwers[tunnel].pop(ant, None)
+                self.dirty.add(tunnel)
+
+    def placed(self, ant, place):
+        """Records an ant that was just deployed at PLACE."""
+        tunnel, step = self.positions[place]
+        self.owned[ant] = tunnel
+        self.placements += 1
+        if isinstance(ant, ants.ThrowerAnt):
+            hi = min(ant.max_range, self.length)
+            self.throwers[tunnel][ant] = (step, ant.damage, ant.min_range, hi)
+        self.dirty.add(tunnel)
+
+    def _window(self, tunnel):
+        """The damage a bee takes walking to the base from each step."""
+        hits = [0] * self.length
+        for step, damage, lo, hi in self.throwers[tunnel].values():
+            for s in range(step + lo, min(step + hi, self.length - 1) + 1):
+                hits[s] += damage
+        window, total = [], 0
+        for s in range(self.length):
+            total += hits[s]
+            window.append(total)
+        return window
+
+    def _gains(self, bees, window):
+        """The threat of (step, health, count) BEES given the damage WINDOW,
+        and for each defender, how much one more at each step lowers it.
+        """
+        threat = sum(count * max(0, health - window[step]) for step, health, count in bees)
+        gains = []
+        for constructor in self.defenders:
+            lo, hi = constructor.min_range, min(constructor.max_range, self.length)
+            row = []
+            for step in range(self.length):
+                gain = 0
+                for s, health, count in bees:
+                    overlap = min(s, step + hi) - (step + lo) + 1
+                    if overlap > 0:
+                        left = health - window[s]
+                        if left > 0:
+                            gain += count * min(left, constructor.damage * overlap)
+                row.append(gain)
+            gains.append(row)
+        return threat, gains
+
+    def _evaluate(self, tunnel):
+        """Recomputes the tunnel's threat and best placement of each defender."""
+        window = self._window(tunnel)
+        key = tuple(window)
+        if key not in self.future_gains:  # Shared by tunnels with the same throwers
+            share = FUTURE_WEIGHT / self.tunnels
+            future = [(self.length - 1, health, n * share) for health, n in self.future.items() if n]
+            self.future_gains[key] = self._gains(future, window)
+        threat, gains = self.future_gains[key]
+        grouped = Counter()
+        for step, health, count in self.bees[tunnel].values():
+            grouped[step, health] += count
+        if grouped:
+            bees = [(step, health, count) for (step, health), count in grouped.items()]
+            urgent, board = self._gains(bees, window)
+            gains = [[a + b for a, b in zip(*rows)] for rows in zip(gains, board)]
+        else:
+            urgent = 0
+        self.urgent_total += urgent - self.urgent[tunnel]
+        self.urgent[tunnel] = urgent
+        self.threat[tunnel] = threat + urgent
+        self.version[tunnel] += 1
+        version = self.version[tunnel]
+        free = [step for step, place in enumerate(self.places[tunnel])
+                if place.ant is None and not isinstance(place, ants.Water)]
+        for constructor, row in zip(self.defenders, gains):
+            if not free:
+                break
+            step = max(free, key=row.__getitem__)
+            if row[step] > 0:
+                entry = (-row[step] / constructor.food_cost, tunnel, version,
+                         self.places[tunnel][step])
+                heapq.heappush(self.heaps[constructor.name], entry)
+        for step, place in enumerate(self.places[tunnel]):
+            if place.ant is None and not place.bees and not isinstance(place, ants.Water):
+                entry = ((step, self.threat[tunnel]), tunnel, version, place)
+                heapq.heappush(self.heaps['Harvester'], entry)
+                break
+
+    def _top(self, name):
+        """The freshest best entry in NAME's heap, or None."""
+        heap = self.heaps[name]
+        while heap and heap[0][2] != self.version[heap[0][1]]:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def choose(self, food):
+        """The (ant type name, place) with the most value per food that FOOD
+        can pay for, or None.
+        """
+        for tunnel in self.dirty:
+            self._evaluate(tunnel)
+        self.dirty.clear()
+        choice, top = None, 0
+        for constructor in self.defenders:
+            entry = self._top(constructor.name)
+            if entry is None:
+                continue
+            value = -entry[0]
+            top = max(top, value)
+            if constructor.food_cost <= food and (choice is None or value > choice[0]):
+                choice = (value, constructor.name, entry[3])
+        harvester = self._harvester(food, top)
+        if harvester and (choice is None or harvester[0] > choice[0]):
+            choice = harvester
+        return choice and choice[1:]
+
+    def _harvester(self, food, top):
+        """A Harvester at the free place nearest the base, in the least
+        threatened tunnel, or None. TOP is the value per food of the best
+        defender. Places further out are worth less, since bees reach them
+        sooner and they crowd out defenders.
+        """
+        if self.harvester is None:
+            return None
+        cost = self.harvester.food_cost
+        turns_left = self.last_wave + self.length - self.time
+        if cost > food or turns_left <= 0:
+            return None
+        entry = self._top('Harvester')
+        if entry is None:
+            return None
+        exposure = (1 - entry[0][0] / self.length) ** 2
+        value = top * HARVEST_VALUE * turns_left * exposure / cost / (1 + self.urgent_total)
+        return (value, 'Harvester', entry[3])
+
+
+def forecast_strategy(gamestate):
+    """Deploys, while food lasts, the ant the threat forecast values most."""
+    forecast = getattr(gamestate, 'forecast', None)
+    if forecast is None:
+        forecast = gamestate.forecast = ThreatForecast(gamestate)
+    forecast.update(gamestate)
+    while True:
+        choice = forecast.choose(gamestate.food)
+        if choice is None:
+            return
+        name, place = choice
+        ant = gamestate.deploy_ant(place.name, name)
+        forecast.placed(ant, place)
+
+
+def scaled_plan(make_plan, factor):
+    """MAKE_PLAN's waves with FACTOR times as many bees in each."""
+    plan = ants.AssaultPlan()
+    for t, wave in make_plan(ants).items():
+        for bee in wave:
+            plan.add_wave(type(bee), bee.health, t, factor)
+    return plan
+
+def benchmark(tunnels=128, length=10, plan='normal', seed=0):
+    """Plays one game of forecast_strategy on a board of TUNNELS tunnels, with
+    PLAN's waves scaled to match. Returns the game and, for each turn, the
+    seconds the strategy took and the number of ants it placed.
+    """
+    import contextlib, io, random
+    make_plan, plan_tunnels = PLANS[plan]
+    latencies = []
+    def timed_strategy(gamestate):
+        placed = gamestate.forecast.placements if hasattr(gamestate, 'forecast') else 0
+        start = time.perf_counter()
+        forecast_strategy(gamestate)
+        latencies.append((time.perf_counter() - start,
+                          gamestate.forecast.placements - placed))
+    random.seed(seed)
+    beehive = ants.Hive(scaled_plan(make_plan, max(1, tunnels // plan_tunnels)))
+    gamestate = ants.GameState(timed_strategy, beehive, ants.ant_types(), ants.dry_layout,
+                               (tunnels, length), 2 * tunnels)
+    with contextlib.redirect_stdout(io.StringIO()):
+        gamestate.simulate()
+    return latencies, gamestate
+
+@main
+def run(*args):
+    """Benchmarks decision latency: [tunnels (128)] [plan (normal)]"""
+    tunnels = int(args[0]) if args else 128
+    plan = args[1] if len(args) > 1 else 'normal'
+    latencies, gamestate = benchmark(tunnels, plan=plan)
+    turns = sorted(seconds for seconds, _ in latencies)
+    percentile = lambda q: turns[min(len(turns) - 1, int(q * len(turns)))] * 1e6
+    placed = sum(n for _, n in latencies)
+    print('{0} tunnels, {1} turns ({2}), {3} ants placed'.format(
+        tunnels, len(turns), 'won' if gamestate.outcome else 'lost', placed))
+    print('per turn: median {0:.0f}us, p99 {1:.0f}us, max {2:.0f}us'.format(
+        percentile(0.5), percentile(0.99), turns[-1] * 1e6))
+    print('per placement: mean {0:.0f}us'.format(sum(turns) / max(placed, 1) * 1e6))
@@ -7,9 +7,18 @@ from ucb import *
 from math import pi
 import math
 import os
+import queue
 import random
+import threading
+import weakref
+from collections import deque, namedtuple
+from itertools import count
 
 STRATEGY_SECONDS = 1
+# Turns the simulation may run ahead of the display. At 0 the game waits on
+# the turn on screen and clicks apply to it at once; more suits headless or
+# fast-forward play, where a click lands on a turn not yet shown.
+LOOKAHEAD_TURNS = 0
 INSECT_FILES = {'Worker': 'ant_harvester.gif',
                 'Thrower': 'ant_thrower.gif',
                 'Long': 'ant_longthrower.gif',
@@ -47,7 +56,13 @@ CRYPT = 650
 MESSAGE_POS = (150, 20)
 HIVE_HEIGHT = 300
 PLACE_MARGIN = 10
+SCROLL_STEP = 120  # Screen pixels the viewport moves per arrow key or wheel notch
+ZOOM_LEVELS = (1, 2, 3)  # Image subsample factors, from closest to farthest
+PLAY_TAG = 'play'  # Canvas tag of the items drawn for places and their insects
+CLICK_CELL_SIZE = 64  # Side of a square cell in the click hit-testing grid
 LASER_OFFSET = (60, 40)
+MAX_PROJECTILES = 24  # Leaves and lasers animated at once; extra throws are not drawn
+LEAF_LENGTH = 40
 LEAF_START_OFFSET = (30, 30)
 LEAF_END_OFFSET = (50, 30)
 LEAF_COLORS = {'Thrower': 'ForestGreen',
@@ -60,11 +75,84 @@ LEAF_COLORS = {'Thrower': 'ForestGreen',
                'Laser': 'Blue'}
 
 
+# An insect as it was when a turn's snapshot was taken. ID stays the same
+# for the insect's whole life, and keys its image.
+InsectView = namedtuple('InsectView', 'id name health')
+# What a place held when a turn's snapshot was taken, as InsectViews
+PlaceView = namedtuple('PlaceView', 'ant contained bees')
+# An immutable picture of the game at the start of a turn. Unchanged places
+# share their PlaceView with the previous snapshot; CHANGED names the others.
+Snapshot = namedtuple('Snapshot', 'time food places changed throws final')
+
+
 class AntsGUI:
     """GUI-based interactive strategy that logs all gamestate updates."""
 
-    def __init__(self):
+    def __init__(self, lookahead=LOOKAHEAD_TURNS):
         self.initialized = False
+        self.gamestate = None
+        self.result = None
+        self.view = None  # The Snapshot on screen
+        self.lookahead = lookahead
+        self._throws = []  # (ant name, from place, to place) thrown this turn
+        self._places = {}  # Latest PlaceView of every place
+        self._versions = {}  # place name -> Place.version its PlaceView was taken at
+        self._insect_ids = weakref.WeakKeyDictionary()  # Insect -> InsectView id
+        self._next_id = count()
+        self._snapshots = queue.Queue()  # Published by the game thread
+        self._credits = threading.Semaphore(lookahead)  # Turns it may run ahead
+        self._commands = deque()  # Deployments for the game thread to apply
+        self._awaiting = False  # True while the display waits for a snapshot
+
+    def play(self, simulate):
+        """Plays a game, rendering it on a single, persistent Tk event loop.
+
+        SIMULATE plays a whole game using self.strategy on a worker thread.
+        That thread publishes a Snapshot at the start of every turn and may run
+        up to self.lookahead turns ahead of the one being displayed.
+        """
+        def run_game():
+            try:
+                self.result = simulate()
+            finally:
+                final = None
+                if self.gamestate is not None:
+                    final = self._capture(self.gamestate, final=True)
+                self._snapshots.put(final)
+        def record_throw(ant, target):
+            self._throws.append((ant.name, ant.place.name, target.place.name))
+        ants.ThrowerAnt.throw_callback = record_throw
+        threading.Thread(target=run_game, daemon=True).start()
+        self.view = self._snapshots.get()
+        if self.view is not None and not self.view.final:
+            self.initialize_colony_graphics(self.gamestate)
+            self.canvas.mainloop()
+        return self.result
+
+    def _capture(self, gamestate, final=False):
+        """Takes a Snapshot, rebuilding views only for places that changed."""
+        changed = set()
+        for name, place in gamestate.places.items():
+            if self._versions.get(name) != place.version:
+                self._versions[name] = place.version
+                contained = getattr(place.ant, 'ant_contained', None)
+                self._places[name] = PlaceView(self._insect_view(place.ant),
+                                               self._insect_view(contained),
+                                               tuple(map(self._insect_view, place.bees)))
+                changed.add(name)
+        throws, self._throws = tuple(self._throws), []
+        return Snapshot(gamestate.time, gamestate.food, dict(self._places),
+                        frozenset(changed), throws, final)
+
+    def _insect_view(self, insect):
+        """Copies what the display needs of INSECT, which the game thread may
+        change before the snapshot is shown.
+        """
+        if insect is None:
+            return None
+        if insect not in self._insect_ids:
+            self._insect_ids[insect] = next(self._next_id)
+        return InsectView(self._insect_ids[insect], insect.name, insect.health)
 
     def initialize_colony_graphics(self, gamestate):
         """Create canvas, control panel, places, and labels."""
@@ -72,13 +160,18 @@ class AntsGUI:
         self.canvas = graphics.Canvas()
         self.food_text = self.canvas.draw_text('Food: 1  Time: 0', (20, 20))
         self.ant_text = self.canvas.draw_text('Ant selected: None', (20, 140))
-        self._click_rectangles = list()
+        self._click_grid = dict()  # (column, row) -> click rectangles overlapping that cell
         self._init_control_panel(gamestate)
         self._init_places(gamestate)
+        self.projectiles = ProjectilePool(self.canvas)
+        self._bind_view_controls()
 
         start_text = self.canvas.draw_text('CLICK TO START', MESSAGE_POS)
-        self.canvas.wait_for_click()
-        self.canvas.clear(start_text)
+        def start(pos):
+            self.canvas.clear(start_text)
+            self.canvas.on_click(self._click)
+            self._begin_turn(self.view)
+        self.canvas.on_click(start)
 
     def _init_control_panel(self, gamestate):
         """Constructs the control panel of available ant types."""
@@ -103,13 +196,28 @@ class AntsGUI:
             panel_pos = shift_point(panel_pos, (width + 2, 0))
 
     def _init_places(self, gamestate):
-        """Constructs places in the play area."""
+        """Lays out places in the play area.
+
+        Places are positioned in world coordinates; their canvas items and
+        click rectangles only exist while they are inside the viewport.
+        """
         self.place_points = dict()
-        # self.images: place_name -> insect instance -> image id
+        self.place_order = []  # Names of drawable places, in gamestate order
+        # self.images: place_name -> InsectView id -> image id
         self.images = {'Ant Home Base': dict()}
+        # self.image_index: InsectView id -> (place_name, image id)
+        self.image_index = dict()
+        self.place_items = dict()  # place_name -> ids of its frame and tunnel
+        self.visible = []  # Names of places currently drawn, in gamestate order
+        self.shown = set()
+        self._place_grid = dict()  # World (column, row) -> place click rectangles
+        self.view_offset = (0, 0)
+        self.zoom = ZOOM_LEVELS[0]
+        self.drawn = None  # (offset, zoom) the visible places were drawn at
         place_pos = PLACE_POS
         width = BEE_IMAGE_WIDTH + 2 * PLACE_PADDING[0]
         height = ANT_IMAGE_HEIGHT + 2 * PLACE_PADDING[1]
+        self.place_size = (width, height)
         rows = 0
         for name, place in gamestate.places.items():
             if place.name == 'Hive':
@@ -120,25 +228,23 @@ class AntsGUI:
                 rows += 1
             def on_click(gamestate, frame, name=name):
                 ant_type = self.ant_type_selected
-                existing_ant = gamestate.places[name].ant
-                if ant_type == 'Remover':
-                    if existing_ant is not None:
-                        print("gamestate.remove_ant('{0}')".format(name))
-                        gamestate.remove_ant(name)
-                        self._update_places(gamestate)
-                elif ant_type is not None:
-                    try:
-                        print("gamestate.deploy_ant('{0}', '{1}')".format(name,
-                                                                       ant_type))
-                        gamestate.deploy_ant(name, ant_type)
-                        self._update_places(gamestate)
-                    except Exception as e:
-                        print(e)
-            color = 'Blue' if place.name.startswith('water') else 'White'
-            frame = self.add_click_rect(place_pos, width, height, on_click,
-                                             color=color)
-            self.canvas.draw_image(place_pos, TUNNEL_FILE)
+                def deploy(gamestate):
+                    existing_ant = gamestate.places[name].ant
+                    if ant_type == 'Remover':
+                        if existing_ant is not None:
+                            print("gamestate.remove_ant('{0}')".format(name))
+                            gamestate.remove_ant(name)
+                    elif ant_type is not None:
+                        try:
+                            print("gamestate.deploy_ant('{0}', '{1}')".format(name,
+                                                                           ant_type))
+                            gamestate.deploy_ant(name, ant_type)
+                        except Exception as e:
+                            print(e)
+                self._submit(deploy)
+            self._add_rect(self._place_grid, (place_pos, width, height, None, on_click))
             self.place_points[name] = place_pos
+            self.place_order.append(name)
             self.images[name] = dict()
             place_pos = shift_point(place_pos, (width + PLACE_MARGIN, 0))
 
@@ -146,52 +252,216 @@ class AntsGUI:
         self.images[gamestate.beehive.name] = dict()
         self.place_points[gamestate.beehive.name] = (place_pos[0] + width,
                                                HIVE_HEIGHT)
+        self.place_order.append(gamestate.beehive.name)
         self.laser_end = (BEE_IMAGE_WIDTH + 2 * PLACE_PADDING[0]) * len(gamestate.places)
-        for bee in gamestate.beehive.bees:
-            self._draw_insect(bee, gamestate.beehive.name, True)
+        self.world_size = (max(x for x, _ in self.place_points.values()) + width + BEE_IMAGE_WIDTH,
+                           max(y for _, y in self.place_points.values()) + height + PLACE_MARGIN)
+        self._refresh_view(gamestate)
+
+    def _bind_view_controls(self):
+        """Arrow keys and the mouse wheel scroll the play area; +/- zoom."""
+        moves = {'<Left>': (-SCROLL_STEP, 0), '<Right>': (SCROLL_STEP, 0),
+                 '<Up>': (0, -SCROLL_STEP), '<Down>': (0, SCROLL_STEP),
+                 '<Button-4>': (0, -SCROLL_STEP), '<Button-5>': (0, SCROLL_STEP),
+                 '<Shift-Button-4>': (-SCROLL_STEP, 0), '<Shift-Button-5>': (SCROLL_STEP, 0)}
+        for sequence, (dx, dy) in moves.items():
+            self.canvas.bind(sequence, lambda event, dx=dx, dy=dy: self.scroll(dx, dy))
+        self.canvas.bind('<MouseWheel>',
+                lambda event: self.scroll(0, -SCROLL_STEP if event.delta > 0 else SCROLL_STEP))
+        for key in ('<plus>', '<equal>'):
+            self.canvas.bind(key, lambda event: self.set_zoom(self.zoom - 1))
+        self.canvas.bind('<minus>', lambda event: self.set_zoom(self.zoom + 1))
+
+    def scroll(self, dx, dy):
+        """Moves the viewport by (DX, DY) screen pixels."""
+        ox, oy = self.view_offset
+        self.view_offset = (ox + dx * self.zoom, oy + dy * self.zoom)
+        self._refresh_view(self.gamestate)
+
+    def set_zoom(self, zoom):
+        """Shows the play area at 1/ZOOM scale, if ZOOM is one of ZOOM_LEVELS."""
+        if zoom in ZOOM_LEVELS and zoom != self.zoom:
+            self.zoom = zoom
+            self._refresh_view(self.gamestate)
+
+    def _to_screen(self, pos):
+        """Converts a world position in the play area to a canvas position."""
+        ox, oy = self.view_offset
+        return ((pos[0] - PLACE_POS[0] - ox) / self.zoom + PLACE_POS[0],
+                (pos[1] - PLACE_POS[1] - oy) / self.zoom + PLACE_POS[1])
+
+    def _to_world(self, pos):
+        ox, oy = self.view_offset
+        return ((pos[0] - PLACE_POS[0]) * self.zoom + PLACE_POS[0] + ox,
+                (pos[1] - PLACE_POS[1]) * self.zoom + PLACE_POS[1] + oy)
+
+    def _in_view(self, name):
+        x, y = self._to_screen(self.place_points[name])
+        width, height = self.place_size
+        return x + width / self.zoom > 0 and x < self.canvas.width \
+            and y >= PLACE_POS[1] and y < self.canvas.height
+
+    def _refresh_view(self, gamestate):
+        """Clamps the viewport, draws the places entering it and deletes the
+        places leaving it. Places that stay in view are shifted in one move;
+        a new zoom level redraws them all, since images are scaled when drawn.
+        """
+        ox, oy = self.view_offset
+        max_x = self.world_size[0] - PLACE_POS[0] - (self.canvas.width - PLACE_POS[0]) * self.zoom
+        max_y = self.world_size[1] - PLACE_POS[1] - (self.canvas.height - PLACE_POS[1]) * self.zoom
+        self.view_offset = (min(max(ox, 0), max(max_x, 0)), min(max(oy, 0), max(max_y, 0)))
+        visible = [name for name in self.place_order if self._in_view(name)]
+        kept = set()
+        if self.drawn is not None and self.drawn[1] == self.zoom:
+            kept = self.shown.intersection(visible)
+            (drawn_x, drawn_y), zoom = self.drawn
+            dx, dy = (drawn_x - self.view_offset[0]) / zoom, (drawn_y - self.view_offset[1]) / zoom
+            if dx or dy:
+                self.canvas.move(PLAY_TAG, dx, dy)
+        for name in self.visible:
+            if name not in kept:
+                self._hide_place(name)
+        for name in visible:
+            if name not in kept:
+                self._show_place(name, gamestate)
+        self.visible, self.shown = visible, set(visible)
+        self.drawn = (self.view_offset, self.zoom)
+
+    def _show_place(self, name, gamestate):
+        """Creates the canvas items for place NAME and the insects in it."""
+        place = self.view.places[name]
+        is_hive = name == gamestate.beehive.name
+        items = []
+        if not is_hive:
+            pos = self._to_screen(self.place_points[name])
+            width, height = self.place_size
+            color = 'Blue' if name.startswith('water') else 'White'
+            frame_points = graphics.rectangle_points(pos, width / self.zoom, height / self.zoom)
+            items.append(self.canvas.draw_polygon(frame_points, fill_color=color))
+            items.append(self.canvas.draw_image(pos, TUNNEL_FILE, scale=1 / self.zoom))
+            # Beneath the insects, projectiles and text already on the canvas
+            self.canvas.lower_to_background(*items)
+            for item in items:
+                self.canvas._canvas.addtag_withtag(PLAY_TAG, item)
+        self.place_items[name] = items
+        if place.ant is not None:
+            self._draw_insect(place.ant, name)
+            if place.contained is not None:
+                container = self.images[name][place.ant.id]
+                self._draw_insect(place.contained, name, behind=container)
+        for bee in place.bees:
+            self._draw_insect(bee, name, is_hive)
+
+    def _hide_place(self, name):
+        """Deletes the canvas items for place NAME and the insects in it."""
+        for insect in self.images[name]:
+            del self.image_index[insect]
+        self.canvas.delete(*self.place_items.pop(name, []), *self.images[name].values())
+        self.images[name].clear()
 
     def add_click_rect(self, pos, width, height, on_click, color='White'):
         """Constructs a rectangle that can be clicked."""
         frame_points = graphics.rectangle_points(pos, width, height)
         frame = self.canvas.draw_polygon(frame_points, fill_color=color)
-        self._click_rectangles.append((pos, width, height, frame, on_click))
+        rect = (pos, width, height, frame, on_click)
+        self._add_rect(self._click_grid, rect)
         return frame
 
+    def _add_rect(self, grid, rect):
+        """Registers RECT in every CLICK_CELL_SIZE cell of GRID it overlaps."""
+        (x, y), width, height = rect[:3]
+        for col in range(int(x // CLICK_CELL_SIZE), int((x + width) // CLICK_CELL_SIZE) + 1):
+            for row in range(int(y // CLICK_CELL_SIZE), int((y + height) // CLICK_CELL_SIZE) + 1):
+                grid.setdefault((col, row), []).append(rect)
+
+    def _find_rect(self, grid, pos):
+        x, y = pos
+        cell = (int(x // CLICK_CELL_SIZE), int(y // CLICK_CELL_SIZE))
+        for rect in grid.get(cell, ()):
+            (cx, cy), width, height = rect[:3]
+            if x >= cx and x <= cx + width and y >= cy and y <= cy + height:
+                return rect
+
     def strategy(self, gamestate):
-        """The strategy function is called by the ants.GameState each turn."""
-        if not self.initialized:
-            self.initialize_colony_graphics(gamestate)
-        elapsed = 0  # Physical time elapsed this turn
-        while elapsed < STRATEGY_SECONDS:
-            self._update_control_panel(gamestate)
-            self._update_places(gamestate)
-            msg = 'Food: {0}  Time: {1}'.format(gamestate.food, gamestate.time)
-            self.canvas.edit_text(self.food_text, text=msg)
-            pos, el = self.canvas.wait_for_click(STRATEGY_SECONDS - elapsed)
-            elapsed += el
-            if pos is not None:
-                self._interpret_click(pos, gamestate)
-
-        # Throws leaves at the end of the turn
-        has_ant = lambda a: hasattr(a, 'ant_contained') and a.ant_contained
-        for ant in gamestate.ants + [a.ant_contained for a in gamestate.ants if has_ant(a)]:
-            if ant.name in LEAF_COLORS:
-                self._throw(ant, gamestate)
+        """The strategy function is called by the ants.GameState each turn.
+
+        Publishes a snapshot of the turn, waits until the display is no more
+        than self.lookahead turns behind, then applies queued deployments.
+        """
+        self.gamestate = gamestate
+        self._snapshots.put(self._capture(gamestate))
+        self._credits.acquire()
+        while self._commands:
+            self._commands.popleft()(gamestate)
+
+    def _submit(self, command):
+        """Runs COMMAND(gamestate) now if the game thread is waiting on the
+        turn on screen; otherwise queues it for the game thread's next turn.
+        """
+        if self.lookahead == 0 and not self._awaiting:
+            command(self.gamestate)
+            self._render(self._capture(self.gamestate))
+        else:
+            self._commands.append(command)
+
+    def _begin_turn(self, snapshot):
+        """Shows SNAPSHOT and schedules the end of its turn."""
+        for ant_name, source, target in snapshot.throws:
+            if ant_name in LEAF_COLORS:
+                self._throw(ant_name, source, target)
+        self._render(snapshot)
+        if snapshot.final:
+            msg = 'YOU WIN' if self.result else 'GAME OVER'
+            self.canvas.draw_text(msg + ' - CLICK TO EXIT', MESSAGE_POS)
+            self.canvas.on_click(lambda pos: self.canvas.quit())
+        else:
+            self.canvas.after(STRATEGY_SECONDS, self._end_turn)
+
+    def _render(self, snapshot):
+        self.view = snapshot
+        self._update_control_panel(self.gamestate)
+        self._update_places(snapshot)
+        self._update_status()
+
+    def _end_turn(self):
+        """Lets the game thread run another turn and shows the next one."""
+        self._awaiting = True
+        self._credits.release()
+        self._next_turn()
+
+    def _next_turn(self):
+        try:
+            snapshot = self._snapshots.get_nowait()
+        except queue.Empty:
+            # The simulation is behind the display; check again next frame
+            self.canvas.after(graphics.FRAME_TIME, self._next_turn)
+            return
+        self._awaiting = False
+        self._begin_turn(snapshot)
+
+    def _click(self, pos):
+        """Handles a click during a turn as soon as it happens."""
+        self._interpret_click(pos, self.gamestate)
+
+    def _update_status(self):
+        msg = 'Food: {0}  Time: {1}'.format(self.view.food, self.view.time)
+        self.canvas.edit_text(self.food_text, text=msg)
 
     def _interpret_click(self, pos, gamestate):
         """Interprets a click position by finding its click rectangle."""
-        x, y = pos
-        for corner, width, height, frame, on_click in self._click_rectangles:
-            cx, cy = corner
-            if x >= cx and x <= cx + width and y >= cy and y <= cy + height:
-                on_click(gamestate, frame)
+        rect = self._find_rect(self._click_grid, pos)
+        if rect is None and pos[1] >= PLACE_POS[1]:
+            rect = self._find_rect(self._place_grid, self._to_world(pos))
+        if rect is not None:
+            corner, width, height, frame, on_click = rect
+            on_click(gamestate, frame)
 
     def _update_control_panel(self, gamestate):
         """Reflects the game state in the control panel."""
         for name, frame in self.ant_type_frames:
             cost = gamestate.ant_types[name].food_cost
             color = 'White'
-            if cost > gamestate.food:
+            if cost > self.view.food:
                 color = 'Gray'
             elif name == self.ant_type_selected:
                 color = 'Blue'
@@ -199,60 +469,111 @@ class AntsGUI:
                 self.canvas.edit_text(self.ant_text, text=msg)
             self.canvas._canvas.itemconfigure(frame, fill=color)
 
-    def _update_places(self, gamestate):
-        """Reflects the game state in the play area.
+    def _update_places(self, snapshot):
+        """Reflects SNAPSHOT in the play area, visiting only the places inside
+        the viewport whose contents changed since the previous snapshot.
         """
-        for name, place in gamestate.places.items():
-            if place.name == 'Hive':
+        # Where every insect in a changed place ended up
+        arrivals = {}
+        for name in snapshot.changed:
+            place = snapshot.places[name]
+            for insect in (place.ant, place.contained) + place.bees:
+                if insect is not None:
+                    arrivals[insect.id] = name
+        for name in self.visible:
+            if name not in snapshot.changed:
                 continue
+            place = snapshot.places[name]
             current = self.images[name].keys()
 
             if place.ant is not None:
-                if isinstance(place.ant, ants.ContainerAnt) \
-                    and place.ant.ant_contained and place.ant.ant_contained not in current:
-                    container = self.images[name][place.ant]
-                    self._draw_insect(place.ant.ant_contained, name, behind=container)
-                if place.ant not in current:
+                if place.ant.id not in current:
                     self._draw_insect(place.ant, name)
+                if place.contained is not None and place.contained.id not in current:
+                    container = self.images[name][place.ant.id]
+                    self._draw_insect(place.contained, name, behind=container)
             for bee in place.bees:
-                if bee not in current:
-                    other_places = [p for p, i in self.images.items() if bee in i]
-                    if other_places:
-                        other_place = other_places[0]
-                        image = self.images[other_place].pop(bee)
-                        pos = shift_point(self.place_points[name], PLACE_PADDING)
+                if bee.id not in current:
+                    if bee.id in self.image_index:
+                        other_place, image = self.image_index[bee.id]
+                        self.images[other_place].pop(bee.id)
+                        pos = self._insect_pos(name)
                         self.canvas.slide_shape(image, pos, STRATEGY_SECONDS)
-                        self.images[name][bee] = image
+                        self.images[name][bee.id] = image
+                        self.image_index[bee.id] = (name, image)
                     else:
-                        # Bee not found for some reason...
-                        pass
+                        # Entered the viewport from a place that is not drawn
+                        self._draw_insect(bee, name)
 
             # Removes expired insects
-            valid_insects = set(place.bees + [place.ant])
-            if place.ant is not None and isinstance(place.ant, ants.ContainerAnt):
-                valid_insects.add(place.ant.ant_contained)
+            valid_insects = set(insect.id for insect in place.bees + (place.ant, place.contained)
+                                if insect is not None)
             for insect in current - valid_insects:
-                if not place.exit or insect not in self.images[place.exit.name] and insect not in place.entrance.bees:
+                if insect in arrivals:
+                    if arrivals[insect] not in self.shown:
+                        # Left the viewport
+                        self.canvas.delete(self.images[name].pop(insect))
+                        del self.image_index[insect]
+                    # Otherwise its new place slides the image over
+                else:
                     image = self.images[name].pop(insect)
-                    pos = (self.place_points[name][0], CRYPT)
+                    del self.image_index[insect]
+                    pos = (self._to_screen(self.place_points[name])[0], CRYPT)
                     self.canvas.slide_shape(image, pos, STRATEGY_SECONDS)
 
+    def _insect_pos(self, place_name):
+        return self._to_screen(shift_point(self.place_points[place_name], PLACE_PADDING))
+
     def _draw_insect(self, insect, place_name, random_offset=False, behind=0):
         """Draws an insect and store the ID of its image."""
         image_file = INSECT_FILES[insect.name]
-        pos = shift_point(self.place_points[place_name], PLACE_PADDING)
+        pos = self._insect_pos(place_name)
         if random_offset:
-            pos = shift_point(pos, (random.randint(-10, 10), random.randint(-50, 50)))
-        image = self.canvas.draw_image(pos, image_file, behind=behind)
-        self.images[place_name][insect] = image
-
-    def _throw(self, ant, gamestate):
-        """Animates a leaf thrown at a Bee."""
-        bee = ant.nearest_bee()  # nearest_bee logic from ants.py
-        if bee:
-            start = shift_point(self.place_points[ant.place.name], LEAF_START_OFFSET)
-            end = shift_point(self.place_points[bee.place.name], LEAF_END_OFFSET)
-            animate_leaf(self.canvas, start, end, color=LEAF_COLORS[ant.name])
+            offset = (random.randint(-10, 10), random.randint(-50, 50))
+            pos = shift_point(pos, [d / self.zoom for d in offset])
+        image = self.canvas.draw_image(pos, image_file, scale=1 / self.zoom, behind=behind)
+        self.canvas._canvas.addtag_withtag(PLAY_TAG, image)
+        self.images[place_name][insect.id] = image
+        self.image_index[insect.id] = (place_name, image)
+
+    def _throw(self, ant_name, source, target):
+        """Animates a leaf thrown from place SOURCE at a Bee in place TARGET."""
+        if source not in self.shown and target not in self.shown:
+            return
+        start = self._to_screen(shift_point(self.place_points[source], LEAF_START_OFFSET))
+        end = self._to_screen(shift_point(self.place_points[target], LEAF_END_OFFSET))
+        animate_leaf(self.canvas, start, end, color=LEAF_COLORS[ant_name],
+                     pool=self.projectiles)
+
+class ProjectilePool:
+    """Recycles hidden canvas items for leaves and lasers.
+
+    At most LIMIT projectiles are on screen at once; take returns None past it.
+    """
+
+    def __init__(self, canvas, limit=MAX_PROJECTILES):
+        self.canvas = canvas
+        self.limit = limit
+        self.active = 0
+        self.free = {'leaf': [], 'laser': []}
+
+    def take(self, kind, create, **options):
+        """Returns a visible item of KIND, reusing a free one when possible."""
+        if self.active >= self.limit:
+            return None
+        self.active += 1
+        if self.free[kind]:
+            id = self.free[kind].pop()
+            self.canvas._canvas.itemconfigure(id, state='normal', **options)
+            return id
+        return create()
+
+    def release(self, kind, id):
+        """Hides item ID and keeps it for the next projectile of KIND."""
+        self.canvas.cancel_animation(id)
+        self.canvas._canvas.itemconfigure(id, state='hidden')
+        self.free[kind].append(id)
+        self.active -= 1
 
 def leaf_coords(pos, angle, length):
     """Returns the coordinates of a leaf polygon."""
@@ -260,29 +581,45 @@ def leaf_coords(pos, angle, length):
     distances = [length/3, length/2, length, length/2]
     return [graphics.translate_point(pos, a, d) for a, d in zip(angles, distances)]
 
-def animate_laser(canvas, start, length, duration=0.6, color='cyan'):
-    laser = canvas.draw_line(start, (length, start[1]), color, width=3)
-    canvas._canvas.after(int(1000*duration) + 1, lambda: canvas.clear(laser))
+def animate_laser(canvas, start, length, duration=0.6, color='cyan', pool=None):
+    create = lambda: canvas.draw_line(start, (length, start[1]), color, width=3)
+    if pool is None:
+        laser = create()
+        canvas._canvas.after(int(1000*duration) + 1, lambda: canvas.clear(laser))
+        return
+    laser = pool.take('laser', create, fill=color)
+    if laser is None:
+        return
+    canvas._canvas.coords(laser, start[0], start[1], length, start[1])
+    canvas._canvas.after(int(1000*duration) + 1, lambda: pool.release('laser', laser))
 
-def animate_leaf(canvas, start, end, duration=0.3, color='ForestGreen'):
+def animate_leaf(canvas, start, end, duration=0.3, color='ForestGreen', pool=None):
     """Defines the animation frames for a thrown leaf."""
-    length = 40
-    leaf = canvas.draw_polygon(leaf_coords(start, 0, length),
+    length = LEAF_LENGTH
+    create = lambda: canvas.draw_polygon(leaf_coords(start, 0, length),
             color='DarkGreen', fill_color=color, smooth=1)
+    if pool is None:
+        leaf = create()
+    else:
+        leaf = pool.take('leaf', create, fill=color)
+        if leaf is None:
+            return
     num_frames = duration / graphics.FRAME_TIME
     increment = tuple([(e-s) / num_frames for s, e in zip(start, end)])
     def points_fn(frame_count):
-        nonlocal start
         angle = pi / 8 * frame_count
-        cs = leaf_coords(start, angle, length)
-        start = shift_point(start, increment)
-        return cs
+        pos = shift_point(start, [d * frame_count for d in increment])
+        return leaf_coords(pos, angle, length)
     canvas.animate_shape(leaf, duration, points_fn)
-    canvas._canvas.after(int(1000*duration) + 1, lambda: canvas.clear(leaf))
+    if pool is None:
+        canvas._canvas.after(int(1000*duration) + 1, lambda: canvas.clear(leaf))
+    else:
+        canvas._canvas.after(int(1000*duration) + 1, lambda: pool.release('leaf', leaf))
 
 from utils import *
 @main
 def run(*args):
     ants.Insect.reduce_health = class_method_wrapper(ants.Insect.reduce_health,
             pre=print_expired_insects)
-    ants_strategies.start_with_strategy(args, AntsGUI().strategy, ants)
+    gui = AntsGUI()
+    gui.play(lambda: ants_strategies.start_with_strategy(args, gui.strategy, ants))
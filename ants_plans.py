@@ -76,3 +76,12 @@ def make_extra_hard_assault_plan(ants_impl=None):
     plan.add_wave(ants_impl.Hornet, 5, 28, 2)
     plan.add_wave(ants_impl.Boss, 30, 30, 2)
     return plan
+
+# Difficulty name -> (plan maker, number of tunnels), as in start_with_strategy
+PLANS = {
+    'test': (make_test_assault_plan, 1),
+    'easy': (make_easy_assault_plan, 2),
+    'normal': (make_normal_assault_plan, 3),
+    'hard': (make_hard_assault_plan, 4),
+    'extra-hard': (make_extra_hard_assault_plan, 4),
+}
@@ -0,0 +1,336 @@
+"""An exact solver for small boards: the least food that wins a seeded game.
+
+The search runs on ArrayGameState. At each turn it tries every sequence of
+deployments and removals the food allows, then ends the turn. Within a turn,
+moves are tried in one canonical order, so each set of moves is searched
+once. The search deepens on a food budget: it is run with a budget of 0,
+then again with the least total spending that went over the last budget,
+and so on, so the first win found spends the least food. A line is cut
+off when it would spend more than the budget, or when it reaches a
+position already searched this round with no more food spent. Positions are keyed by a Zobrist hash of the place contents,
+food, time and random state. The pending waves follow from the time. The
+table of searched positions has a fixed number of slots; a collision
+evicts the older entry, which only costs repeated work.
+
+The random state is part of the position, so the answer holds for one
+seed. A game still going after max_turns turns counts as a loss. The
+result is either the cheapest winning schedule or, when the search ends
+without finding one, proof that no schedule of the allowed ants wins
+(within max_food, if given).
+
+The search stops early once it has searched max_nodes positions or run
+for max_seconds. It then reports itself incomplete, along with a lower
+bound: no schedule spending less than that bound wins.
+
+What it can finish depends on how much spending it has to rule out. A
+position costs about 0.2ms. On the test plan (1 tunnel of 10 places) the
+cheapest win, 2 food, takes about 2,000 positions. Each extra step of
+budget multiplies the work by 10 to 20. With only Harvester and Wall
+over 15 turns, ruling out 2, 4 and 6 food took 1.4k, 24k and over 95k
+positions. So the easy plan (2 tunnels), and boards whose cheapest win
+needs more than two or three ants, do not finish within the default
+budgets. For those the result is a lower bound, which --max-food can
+also cap.
+"""
+
+import random
+import time
+import ants
+from ucb import main
+from ants_plans import PLANS
+import ants_arrays
+from ants_arrays import ArrayGameState, ANT_CLASSES, ANT_CODES, FIRE
+
+try:
+    import numpy as np
+except Exception as e:
+    print('Could not load numpy: ' + str(e))
+
+TABLE_SIZE = 1 << 20
+MAX_TURNS = 40
+MAX_NODES = 1000000
+MAX_SECONDS = 300
+MASK = (1 << 64) - 1
+
+def mix(x):
+    """The splitmix64 finalizer of each uint64 in array X: every input bit
+    affects every output bit, so keys that differ in a few high bits still
+    land in different table slots.
+    """
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+def mix_int(x):
+    """mix for one Python int, taken modulo 2**64."""
+    x = (x + 0x9E3779B97F4A7C15) & MASK
+    x = (x ^ x >> 30) * 0xBF58476D1CE4E5B9 & MASK
+    x = (x ^ x >> 27) * 0x94D049BB133111EB & MASK
+    return x ^ x >> 31
+
+class Zobrist:
+    """Random 64-bit keys for each (place, slot, ant type), each (place, rank
+    in the place's bee list, bee type) and each time. Healths, chew
+    countdowns and food are hashed as (key, value) pairs: the value's bits
+    are XORed into a key of their own and the result is passed through mix.
+    """
+
+    def __init__(self, state, max_turns, seed=0):
+        rng = np.random.default_rng(seed)
+        keys = lambda *shape: rng.integers(0, MASK, size=shape, dtype=np.uint64, endpoint=True)
+        places, bees = len(state.place_names), len(state.bee_type)
+        self.ant = keys(places, 2, len(ANT_CLASSES))
+        self.ant_health = keys(places, 2)
+        self.chew = keys(places, 2)
+        self.bee = keys(places, bees, len(ants_arrays.BEE_CLASSES))
+        self.bee_health = keys(places, bees)
+        self.inactive = keys(places, bees)
+        self.time = keys(max_turns + 1)
+        self.food = int(keys(1)[0])
+
+    def hash(self, state, rng_state):
+        """A hash of everything that decides how STATE plays on."""
+        p, slot = np.nonzero(state.ant_type)
+        types = [self.ant[p, slot, state.ant_type[p, slot]]]
+        values = [self.ant_health[p, slot] ^ state.ant_health[p, slot].view(np.uint64),
+                  self.chew[p, slot] ^ state.chew[p, slot].view(np.uint64)]
+        bees = np.flatnonzero(state.bee_place >= 0)
+        if len(bees):
+            # A place's bee list is ordered, and throwers choose from it at random
+            bees = bees[np.lexsort((state.bee_seq[bees], state.bee_place[bees]))]
+            where = state.bee_place[bees]
+            rank = np.arange(len(bees)) - np.searchsorted(where, where)
+            types.append(self.bee[where, rank, state.bee_type[bees]])
+            values += [self.bee_health[where, rank] ^ state.bee_health[bees].view(np.uint64),
+                       self.inactive[where, rank] ^ ~state.bee_active[bees]]
+        h = np.concatenate(types + [mix(np.concatenate(values))])
+        key = int(np.bitwise_xor.reduce(h)) if len(h) else 0
+        key ^= int(self.time[state.time]) ^ mix_int(self.food ^ state.food)
+        return key ^ mix_int(hash(rng_state[1]))
+
+
+class TranspositionTable:
+    """A fixed number of slots, each holding one (key, least food spent)."""
+
+    def __init__(self, size=TABLE_SIZE):
+        self.size = size
+        self.keys = [None] * size
+        self.spent = [0] * size
+        self.evictions = 0
+
+    def clear(self):
+        self.keys = [None] * self.size
+
+    def visit(self, key, spent):
+        """Records a visit. Returns True if KEY was already searched having
+        spent no more than SPENT.
+        """
+        slot = key % self.size
+        if self.keys[slot] == key:
+            if self.spent[slot] <= spent:
+                return True
+        elif self.keys[slot] is not None:
+            self.evictions += 1
+        self.keys[slot] = key
+        self.spent[slot] = spent
+        return False
+
+
+class Solver:
+    """Finds the least food that wins a game, searching from the first turn.
+
+    make_plan -- a function that takes the ants module and returns an AssaultPlan
+    ant_names -- the ant types the schedule may use
+    max_nodes, max_seconds -- when to give up; None for no limit
+    report -- called with (budget, positions, seconds) after each budget is ruled out
+    """
+
+    def __init__(self, make_plan, layout=ants.dry_layout, dimensions=(1, 10), food=2,
+                 seed=0, ant_names=None, max_turns=MAX_TURNS, table_size=TABLE_SIZE,
+                 max_nodes=MAX_NODES, max_food=None, max_seconds=MAX_SECONDS, report=None):
+        self.make_plan = make_plan
+        self.layout = layout
+        self.dimensions = dimensions
+        self.food = food
+        self.seed = seed
+        self.codes = sorted(ANT_CODES[name] for name in (ant_names or ANT_CODES))
+        self.max_turns = max_turns
+        self.table = TranspositionTable(table_size)
+        self.zobrist = None
+        self.max_nodes = max_nodes
+        self.max_food = max_food
+        self.max_seconds = max_seconds
+        self.report = report
+        self.deadline = None
+        self.nodes = 0
+        self.budget = self.next_budget = None
+        self.best_spent = None
+        self.best_schedule = None
+        self.incomplete = False
+        self.lower_bound = 0
+
+    def solve(self):
+        """Runs the search. Returns (food spent, schedule) for the cheapest
+        win, or None if none was found. A schedule is a list of (time,
+        place name, ant type name or None to remove) moves.
+
+        incomplete is True if max_nodes or max_seconds ended the search
+        early. lower_bound is then the least food a win could spend: every
+        schedule spending less was searched and lost. After a complete
+        search without a win it is None, or above max_food if that was the
+        limit.
+        """
+        saved = random.getstate()
+        start = time.monotonic()
+        if self.max_seconds is not None:
+            self.deadline = start + self.max_seconds
+        try:
+            random.seed(self.seed)
+            state = ArrayGameState(None, self.make_plan(ants), self.layout,
+                                   self.dimensions, self.food)
+            state.begin_turn()
+            rng_state = random.getstate()
+            self.zobrist = Zobrist(state, self.max_turns)
+            budget = 0
+            while budget is not None and (self.max_food is None or budget <= self.max_food):
+                self.budget, self.next_budget = budget, None
+                self.table.clear()
+                self._search(state, rng_state, 0, (), None)
+                if self.best_schedule is not None:
+                    self.lower_bound = self.best_spent
+                    break
+                if self.incomplete:
+                    break
+                budget = self.lower_bound = self.next_budget
+                if self.report:
+                    self.report(self.budget, self.nodes, time.monotonic() - start)
+        finally:
+            random.setstate(saved)
+        if self.best_schedule is None:
+            return None
+        moves, schedule = self.best_schedule, []
+        while moves:
+            move, moves = moves
+            schedule.append(move)
+        return self.best_spent, schedule[::-1]
+
+    def _moves(self, state, last):
+        """Removals, then deployments, ordered after LAST, as (order, code,
+        place index). A code of 0 removes.
+        """
+        ant_type = state.ant_type
+        moves = []
+        for p in range(len(state.place_names)):
+            if ant_type[p, 0]:
+                moves.append(((0, p, 0), 0, p))
+            for code in self.codes:
+                if ants_arrays.ANT_COST[code] > state.food:
+                    continue
+                if state.water[p] and code != FIRE:
+                    continue  # Spends food for nothing
+                if not self._fits(ant_type[p], code):
+                    continue
+                moves.append(((1, p, code), code, p))
+        if last is not None:
+            moves = [move for move in moves if move[0] > last]
+        return moves
+
+    @staticmethod
+    def _fits(types, code):
+        """The rule of ArrayGameState.deploy_ant."""
+        is_container = ants_arrays.IS_CONTAINER
+        if not types[0]:
+            return True
+        if is_container[types[0]]:
+            return not types[1] and not is_container[code]
+        return bool(is_container[code])
+
+    def _search(self, state, rng_state, spent, moves, last):
+        """Searches from STATE partway through a turn, after the moves
+        linked in MOVES. Stops at the first win.
+        """
+        if self.best_schedule is not None or self.incomplete:
+            return
+        if self.max_nodes is not None and self.nodes >= self.max_nodes or \
+                self.deadline is not None and time.monotonic() >= self.deadline:
+            self.incomplete = True
+            return
+        self.nodes += 1
+        key = self.zobrist.hash(state, rng_state) ^ mix_int(hash(last or ()))
+        if self.table.visit(key, spent):
+            return
+        # End the turn
+        after = state.copy()
+        random.setstate(rng_state)
+        outcome = after.finish_turn()
+        if outcome:
+            self.best_spent, self.best_schedule = spent, moves
+            return
+        if outcome is None and after.time < self.max_turns:
+            after.begin_turn()
+            self._search(after, random.getstate(), spent, moves, None)
+        # Or make one more move this turn
+        for order, code, p in self._moves(state, last):
+            cost = int(ants_arrays.ANT_COST[code]) if code else 0
+            if spent + cost > self.budget:
+                if self.next_budget is None or spent + cost < self.next_budget:
+                    self.next_budget = spent + cost
+                continue
+            after = state.copy()
+            name = state.place_names[p]
+            if code:
+                after.deploy_ant(name, ANT_CLASSES[code].name)
+                move = (state.time, name, ANT_CLASSES[code].name)
+            else:
+                after.remove_ant(name)
+                move = (state.time, name, None)
+            self._search(after, rng_state, spent + cost, (move, moves), order)
+
+
+@main
+def run(*args):
+    import argparse, sys, time
+    parser = argparse.ArgumentParser(description='Exact solver for small Ants vs. SomeBees games')
+    parser.add_argument('-d', default='test', choices=['test', 'easy'],
+                        help='assault plan, with its number of tunnels')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--food', type=int, default=2, help='food at the start')
+    parser.add_argument('--length', type=int, default=10, help='places per tunnel')
+    parser.add_argument('-w', '--water', action='store_true', help='use the wet layout')
+    parser.add_argument('--ants', help='comma-separated ant types to use (default: all supported)')
+    parser.add_argument('--max-turns', type=int, default=MAX_TURNS)
+    parser.add_argument('--max-food', type=int, help='only look for wins spending at most this much')
+    parser.add_argument('--max-nodes', type=int, default=MAX_NODES,
+                        help='give up after searching this many positions (0: no limit)')
+    parser.add_argument('--max-seconds', type=float, default=MAX_SECONDS,
+                        help='give up after this many seconds (0: no limit)')
+    parser.add_argument('--table-size', type=int, default=TABLE_SIZE)
+    args = parser.parse_args()
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 100 * args.max_turns))
+    make_plan, tunnels = PLANS[args.d]
+    def report(budget, nodes, seconds):
+        print('No win spending {0} food ({1} positions, {2:.1f}s)'.format(budget, nodes, seconds))
+    solver = Solver(make_plan, ants.wet_layout if args.water else ants.dry_layout,
+                    (tunnels, args.length), args.food, args.seed,
+                    args.ants.split(',') if args.ants else None,
+                    args.max_turns, args.table_size, args.max_nodes or None, args.max_food,
+                    args.max_seconds or None, report)
+    start = time.time()
+    result = solver.solve()
+    print('{0} positions in {1:.1f}s, {2} table evictions'.format(
+        solver.nodes, time.time() - start, solver.table.evictions))
+    if result is not None:
+        spent, schedule = result
+        print('Least food that wins: {0}'.format(spent))
+        for turn, place_name, ant_type_name in schedule:
+            print('  turn {0}: {1} {2}'.format(
+                turn, 'deploy ' + ant_type_name if ant_type_name else 'remove', place_name))
+    elif solver.incomplete:
+        print('Search incomplete: no schedule spending under {0} food wins.'.format(
+            solver.lower_bound))
+    elif solver.next_budget is not None:
+        print('No schedule spending at most {0} food wins within {1} turns.'.format(
+            args.max_food, args.max_turns))
+    else:
+        print('No schedule wins within {0} turns.'.format(args.max_turns))
@@ -0,0 +1,349 @@
+"""A columnar store for game results, written by many processes and read
+through memory maps.
+
+A store is a directory. Every writer appends to a segment of its own, a
+subdirectory holding one file per column of fixed-width binary values, so
+writers never share a file. A reader maps each column file it needs with
+numpy.memmap; nothing is parsed, and a query only touches the columns it
+filters or aggregates on. A segment cut short by a crash is read up to its
+shortest column. The columns are listed in schema.json when the store is
+created.
+
+Columns: seed, plan, layout, strategy, tunnels, length, winner (1 if the ants
+won, 0 if the bees did, -1 if the game hit the turn limit), turns,
+food_spent, then ants deployed of each type (ant_<name>) and bees destroyed
+of each type (bee_<name>).
+
+The plan, layout and strategy columns hold ids. schema.json also keeps the
+name each id stands for, so a store reads back the same after strategies
+or plans are added or reordered. A writer that meets a name the store has
+not seen adds it to the end of that table.
+"""
+
+import contextlib
+import fcntl
+import io
+import json
+import os
+import random
+import uuid
+from collections import Counter
+import ants
+from ucb import main
+from ants_plans import PLANS
+from ants_strategies import STRATEGIES
+from ants_tournament import MAX_TURNS, START_FOOD, TUNNEL_LENGTH
+
+try:
+    import numpy as np
+except Exception as e:
+    print('Could not load numpy: ' + str(e))
+
+PLAN_NAMES = list(PLANS)
+LAYOUTS = {'dry': ants.dry_layout, 'wet': ants.wet_layout}
+LAYOUT_NAMES = list(LAYOUTS)
+STRATEGY_NAMES = list(STRATEGIES)
+BEE_TYPES = (ants.Bee, ants.Wasp, ants.Hornet, ants.NinjaBee, ants.Boss)
+BATCH = 1024  # Rows a writer buffers before appending
+NAMED = {'plan': PLAN_NAMES, 'layout': LAYOUT_NAMES, 'strategy': STRATEGY_NAMES}
+
+def default_schema():
+    """(column name, dtype string) pairs for the current ant and bee types."""
+    schema = [('seed', '<i8'), ('plan', '|i1'), ('layout', '|i1'), ('strategy', '|i1'),
+              ('tunnels', '<i2'), ('length', '<i2'), ('winner', '|i1'), ('turns', '<i4'),
+              ('food_spent', '<i4')]
+    schema += [('ant_' + cls.name, '<i2') for cls in ants.ant_types()]
+    schema += [('bee_' + cls.__name__, '<i2') for cls in BEE_TYPES]
+    return schema
+
+
+class ResultStore:
+    """A directory of segments, each a set of column files."""
+
+    def __init__(self, path):
+        self.path = path
+        self.schema_path = os.path.join(path, 'schema.json')
+        if not os.path.exists(self.schema_path):
+            os.makedirs(path, exist_ok=True)
+            with self._locked():
+                if not os.path.exists(self.schema_path):
+                    self._write_schema({'columns': default_schema(), 'names': NAMED})
+        self._read_schema()
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Holds the store's lock, which guards changes to schema.json."""
+        with open(os.path.join(self.path, 'schema.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _write_schema(self, schema):
+        tmp = self.schema_path + '.{0}.tmp'.format(os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(schema, f)
+        os.replace(tmp, self.schema_path)
+
+    def _read_schema(self):
+        with open(self.schema_path) as f:
+            schema = json.load(f)
+        if isinstance(schema, list):  # Written before the name tables were kept
+            schema = {'columns': schema, 'names': {column: list(names)
+                                                   for column, names in NAMED.items()}}
+        self.schema = [(name, np.dtype(dtype)) for name, dtype in schema['columns']]
+        self.dtypes = dict(self.schema)
+        self.names = schema['names']  # column -> the name of each id
+
+    def code(self, column, name):
+        """The id of NAME in COLUMN's name table, adding it if it is new."""
+        if name not in self.names[column]:
+            with self._locked():
+                self._read_schema()  # Another writer may have added it
+                if name not in self.names[column]:
+                    self.names[column].append(name)
+                    self._write_schema({'columns': [(n, dtype.str) for n, dtype in self.schema],
+                                        'names': self.names})
+        return self.names[column].index(name)
+
+    def label(self, column, value):
+        """The name behind id VALUE of COLUMN, or VALUE itself for other columns."""
+        if column not in self.names:
+            return str(value)
+        names = self.names[column]
+        return names[int(value)] if 0 <= value < len(names) else str(value)
+
+    def writer(self):
+        return SegmentWriter(self)
+
+    def segments(self):
+        """The segment directories, in name order."""
+        return sorted(os.path.join(self.path, name) for name in os.listdir(self.path)
+                      if name.startswith('part-'))
+
+    def _column_file(self, segment, name):
+        return os.path.join(segment, name + '.bin')
+
+    def rows(self, segment):
+        """Complete rows in SEGMENT: the length of its shortest column."""
+        return min(os.path.getsize(self._column_file(segment, name)) // dtype.itemsize
+                   for name, dtype in self.schema)
+
+    def columns(self, segment, names):
+        """Read-only memmap views of the NAMES columns of SEGMENT, or None if
+        it has no complete rows.
+        """
+        rows = self.rows(segment)
+        if not rows:
+            return None
+        return {name: np.memmap(self._column_file(segment, name), self.dtypes[name],
+                                mode='r', shape=(rows,))
+                for name in names}
+
+    def __len__(self):
+        return sum(self.rows(segment) for segment in self.segments())
+
+
+class SegmentWriter:
+    """Appends rows to a new segment of a store, BATCH rows at a time.
+    Use it as a context manager, or call close, so the last rows are written.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.segment = os.path.join(store.path, 'part-{0}-{1}'.format(
+            os.getpid(), uuid.uuid4().hex[:8]))
+        os.makedirs(self.segment)
+        self.files = {name: open(store._column_file(self.segment, name), 'ab')
+                      for name, _ in store.schema}
+        self.pending = []
+
+    def append(self, row):
+        """Adds ROW, a dict from column name to value. Missing columns are 0,
+        and plan, layout and strategy are given by name.
+        """
+        row = dict(row)
+        for column in self.store.names:
+            if column in row:
+                row[column] = self.store.code(column, row[column])
+        self.pending.append(row)
+        if len(self.pending) >= BATCH:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        for name, dtype in self.store.schema:
+            values = np.array([row.get(name, 0) for row in self.pending], dtype=dtype)
+            self.files[name].write(values.tobytes())
+            self.files[name].flush()
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        for f in self.files.values():
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def play_game(job):
+    """Plays a (plan name, layout name, strategy name, seed) JOB and returns
+    its row, with the plan, layout and strategy by name.
+    """
+    plan_name, layout_name, strategy_name, seed = job
+    make_plan, tunnels = PLANS[plan_name]
+    strategy = STRATEGIES[strategy_name]
+    random.seed(seed)
+    plan = make_plan(ants)
+    gamestate = ants.GameState(strategy, ants.Hive(plan), ants.ant_types(),
+                               LAYOUTS[layout_name], (tunnels, TUNNEL_LENGTH), START_FOOD)
+    deployed, spent = Counter(), [0]
+    deploy_ant = gamestate.deploy_ant
+    def counting_deploy_ant(place_name, ant_type_name):
+        food = gamestate.food
+        ant = deploy_ant(place_name, ant_type_name)
+        deployed[ant_type_name] += 1
+        spent[0] += food - gamestate.food
+        return ant
+    gamestate.deploy_ant = counting_deploy_ant
+    with contextlib.redirect_stdout(io.StringIO()):
+        for record in gamestate.turns():
+            if record.time + 1 >= MAX_TURNS:
+                break
+    alive = Counter(type(bee).__name__ for bee in gamestate.beehive.bees + gamestate.bees)
+    faced = Counter(type(bee).__name__ for bee in plan.all_bees)
+    row = {'seed': seed, 'plan': plan_name, 'layout': layout_name, 'strategy': strategy_name,
+           'tunnels': tunnels, 'length': TUNNEL_LENGTH,
+           'winner': {True: 1, False: 0}.get(gamestate.outcome, -1),
+           'turns': record.time + 1, 'food_spent': spent[0]}
+    row.update(('ant_' + name, n) for name, n in deployed.items())
+    row.update(('bee_' + name, n - alive[name]) for name, n in faced.items())
+    return row
+
+def _fill_worker(args):
+    """Plays JOBS into a segment of its own in the store at PATH."""
+    path, jobs = args
+    with ResultStore(path).writer() as writer:
+        for job in jobs:
+            writer.append(play_game(job))
+    return len(jobs)
+
+def fill(path, jobs, workers=None, chunk=200):
+    """Plays JOBS across WORKERS processes, each appending to the store."""
+    import multiprocessing
+    ResultStore(path)  # Writes the schema once, before the workers start
+    chunks = [(path, jobs[i:i + chunk]) for i in range(0, len(jobs), chunk)]
+    with multiprocessing.Pool(workers) as pool:
+        return sum(pool.imap_unordered(_fill_worker, chunks))
+
+
+OPERATORS = (('<=', np.less_equal), ('>=', np.greater_equal), ('!=', np.not_equal),
+             ('=', np.equal), ('<', np.less), ('>', np.greater))
+
+def check_column(store, name):
+    """Raises ValueError, naming the columns, if STORE has no column NAME."""
+    if name not in store.dtypes:
+        raise ValueError('Unknown column {0}; the columns are {1}'.format(
+            name, ', '.join(store.dtypes)))
+
+def parse_condition(text, store):
+    """'plan=normal' -> ('plan', np.equal, 2). Names of plans, layouts and
+    strategies are turned into their ids in STORE.
+    """
+    for symbol, op in OPERATORS:
+        if symbol in text:
+            name, value = text.split(symbol, 1)
+            check_column(store, name)
+            if name in store.names:
+                if value not in store.names[name]:
+                    raise ValueError('Unknown {0} {1}; the store has {2}'.format(
+                        name, value, ', '.join(store.names[name])))
+                value = store.names[name].index(value)
+            return name, op, float(value)
+    raise ValueError('No comparison in ' + text)
+
+def query(store, where=(), group_by=(), means=()):
+    """Filters with WHERE conditions, groups by the GROUP_BY columns and
+    returns {group key: (rows, {column: mean})}, reading one segment at a
+    time.
+    """
+    totals = {}
+    names = set(name for name, _, _ in where) | set(group_by) | set(means)
+    for segment in store.segments():
+        columns = store.columns(segment, names)
+        if columns is None:
+            continue
+        keep = np.ones(len(next(iter(columns.values()))) if columns else store.rows(segment),
+                       dtype=bool)
+        for name, op, value in where:
+            keep &= op(columns[name], value)
+        if not keep.any():
+            continue
+        codes, uniques = np.zeros(int(keep.sum()), dtype=np.int64), []
+        for name in group_by:  # One integer code per combination of values
+            values, inverse = np.unique(columns[name][keep], return_inverse=True)
+            codes = codes * len(values) + inverse.reshape(-1)
+            uniques.append(values)
+        codes, inverse = np.unique(codes, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        if group_by:
+            indexes = np.unravel_index(codes, [len(values) for values in uniques])
+            groups = np.stack([values[index] for values, index in zip(uniques, indexes)], axis=1)
+        else:
+            groups = np.zeros((1, 0), dtype=int)
+        counts = np.bincount(inverse, minlength=len(groups))
+        sums = {name: np.bincount(inverse, weights=columns[name][keep], minlength=len(groups))
+                for name in means}
+        for i, group in enumerate(groups):
+            key = tuple(group.tolist())
+            n, total = totals.get(key, (0, Counter()))
+            total.update({name: sums[name][i] for name in means})
+            totals[key] = (n + int(counts[i]), total)
+    return {key: (n, {name: total[name] / n for name in means})
+            for key, (n, total) in sorted(totals.items())}
+
+@main
+def run(*args):
+    import argparse, time
+    parser = argparse.ArgumentParser(description='Columnar game results for Ants vs. SomeBees')
+    parser.add_argument('store', help='store directory')
+    parser.add_argument('--fill', type=int, metavar='SEEDS',
+                        help='first play SEEDS seeds of each plan, layout and strategy into the store')
+    parser.add_argument('--plans', default=','.join(PLAN_NAMES[:3]))
+    parser.add_argument('--layouts', default=','.join(LAYOUT_NAMES))
+    parser.add_argument('--strategies', default=','.join(STRATEGY_NAMES))
+    parser.add_argument('--workers', type=int, help='processes for --fill (default: one per core)')
+    parser.add_argument('--where', action='append', default=[],
+                        help='a condition such as plan=normal or turns>20 (repeatable)')
+    parser.add_argument('--group-by', default='', help='comma-separated columns')
+    parser.add_argument('--mean', default='winner,turns,food_spent', help='columns to average')
+    args = parser.parse_args()
+    if args.fill:
+        jobs = [(plan, layout, strategy, seed) for plan in args.plans.split(',')
+                for layout in args.layouts.split(',')
+                for strategy in args.strategies.split(',') for seed in range(args.fill)]
+        start = time.time()
+        fill(args.store, jobs, args.workers)
+        print('Played {0} games in {1:.1f}s'.format(len(jobs), time.time() - start))
+    store = ResultStore(args.store)
+    group_by = [name for name in args.group_by.split(',') if name]
+    means = [name for name in args.mean.split(',') if name]
+    try:
+        for name in group_by + means:
+            check_column(store, name)
+        where = [parse_condition(c, store) for c in args.where]
+    except ValueError as e:
+        parser.error(str(e))
+    start = time.time()
+    results = query(store, where, group_by, means)
+    elapsed = time.time() - start
+    print(' '.join('{0:>18}'.format(name) for name in group_by + ['rows'] + means))
+    for key, (n, averages) in results.items():
+        print(' '.join('{0:>18}'.format(store.label(name, value)) for name, value in zip(group_by, key)) +
+              ' ' * bool(group_by) + '{0:>18}'.format(n) +
+              ''.join(' {0:>18.3f}'.format(averages[name]) for name in means))
+    print('{0} rows in {1} segments, queried in {2:.3f}s'.format(
+        len(store), len(store.segments()), elapsed))
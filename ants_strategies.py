@@ -39,3 +39,70 @@ def start_with_strategy(args, strategy, ants):
     beehive = ants.Hive(assault_plan)
     dimensions = (num_tunnels, tunnel_length)
     return ants.GameState(strategy, beehive, ants.ant_types(), layout, dimensions, food).simulate()
+
+def idle_strategy(gamestate):
+    """Deploys nothing; a baseline for comparisons."""
+
+def _tunnels(gamestate):
+    """The places of each tunnel, nearest the base first."""
+    tunnels = [[] for _ in gamestate.bee_entrances]
+    for tunnel, place in gamestate.tunnel_places:
+        tunnels[tunnel].insert(0, place)
+    return tunnels
+
+def _free(places):
+    return [place for place in places
+            if place.ant is None and not isinstance(place, ants.Water)]
+
+def _steps(gamestate):
+    """Free dry places, nearest the base first, tunnels taking turns."""
+    order = sorted((step, tunnel, place) for tunnel, places in enumerate(_tunnels(gamestate))
+                   for step, place in enumerate(places))
+    return _free([place for step, tunnel, place in order])
+
+def _deploy_while_affordable(gamestate, ant_type_name, places):
+    cost = gamestate.ant_types[ant_type_name].food_cost
+    for place in places:
+        if gamestate.food < cost:
+            return
+        gamestate.deploy_ant(place.name, ant_type_name)
+
+def _harvest(gamestate):
+    """Deploys the colony's next Harvester, returning False once there is
+    one per tunnel.
+    """
+    harvesters = sum(ant.name == 'Harvester' for ant in gamestate.ants)
+    if harvesters >= len(gamestate.bee_entrances):
+        return False
+    safe = [place for place in _steps(gamestate) if not place.bees]
+    _deploy_while_affordable(gamestate, 'Harvester', safe[:1])
+    return True
+
+def harvester_thrower_strategy(gamestate):
+    """One Harvester per tunnel, then Throwers from the base outward."""
+    if not _harvest(gamestate):
+        _deploy_while_affordable(gamestate, 'Thrower', _steps(gamestate))
+
+WALL_STEP = 4
+
+def wall_strategy(gamestate):
+    """One Harvester per tunnel, then a Wall WALL_STEP places out in each
+    tunnel, then Throwers from the base outward.
+    """
+    if _harvest(gamestate):
+        return
+    for places in _tunnels(gamestate):
+        wall = places[min(WALL_STEP, len(places) - 1):]
+        if not any(place.ant and place.ant.name == 'Wall' for place in wall):
+            _deploy_while_affordable(gamestate, 'Wall', _free(wall)[:1])
+    _deploy_while_affordable(gamestate, 'Thrower', _steps(gamestate))
+
+from ants_forecast import forecast_strategy
+
+# Name -> strategy, for tools that compare strategies
+STRATEGIES = {
+    'idle': idle_strategy,
+    'harvester-thrower': harvester_thrower_strategy,
+    'wall': wall_strategy,
+    'forecast': forecast_strategy,
+}
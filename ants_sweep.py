@@ -0,0 +1,284 @@
+"""Sweeps ant stats (food_cost, damage, health) to see how each one changes
+the win rate, sharing the turns that every variant plays alike.
+
+A variant changes one stat of one ant type. Until that stat is first read,
+by a strategy checking a cost, an ant acting, or an ant being created, the
+variant plays exactly like the unchanged game. So each seed is played once
+with probes on the swept stats, which finds the turn where each stat is
+first read. It is then replayed up to each of those turns, and every
+variant of that stat continues from there: in a forked child process, or
+from an in-process copy where os.fork is not available.
+
+Results are kept as columns (seed, ant, stat, value, won, turns, diverged)
+and saved with numpy.savez; a plot of win rate against each stat is drawn
+if matplotlib is installed.
+"""
+
+import contextlib
+import copy
+import inspect
+import io
+import json
+import os
+import random
+import traceback
+import ants
+from ucb import main
+from ants_plans import PLANS
+from ants_strategies import STRATEGIES
+from ants_tournament import MAX_TURNS, START_FOOD, TUNNEL_LENGTH
+
+try:
+    import numpy as np
+except Exception as e:
+    print('Could not load numpy: ' + str(e))
+
+STATS = ('food_cost', 'damage', 'health')
+FAILED = 'FAILED\n'  # Starts what a forked variant sends back in place of a result
+SCALES = (0.5, 0.75, 1, 1.25, 1.5, 2)
+
+class ReadLog:
+    """The turn each (ant name, stat) was first read, and the stat values a
+    variant overrides.
+    """
+
+    def __init__(self):
+        self.time = 0
+        self.first = {}
+        self.overrides = {}
+
+    def read(self, key):
+        if key not in self.first:
+            self.first[key] = self.time
+
+
+class _Probe:
+    """A class attribute that logs its first read and can be overridden."""
+
+    def __init__(self, key, value, log):
+        self.key, self.value, self.log = key, value, log
+
+    def __get__(self, obj, owner):
+        self.log.read(self.key)
+        return self.log.overrides.get(self.key, self.value)
+
+
+def default_stat(cls, stat):
+    """The unchanged value of STAT for ant class CLS."""
+    if stat == 'health':
+        return inspect.signature(cls.__init__).parameters['health'].default
+    return getattr(cls, stat)
+
+def probed_ant_types(log):
+    """ants.ant_types(), each subclassed so that reads of its stats go to LOG."""
+    probed = []
+    for cls in ants.ant_types():
+        attrs = {stat: _Probe((cls.name, stat), getattr(cls, stat), log)
+                 for stat in STATS if stat != 'health'}
+        def __init__(self, *args, base=cls, **kwargs):
+            base.__init__(self, *args, **kwargs)
+            key = (base.name, 'health')
+            log.read(key)
+            if key in log.overrides:
+                self.health = log.overrides[key]
+        attrs['__init__'] = __init__
+        attrs['implemented'] = False  # Keeps probes out of later ant_types() calls
+        probed.append(type(cls.__name__, (cls,), attrs))
+    return probed
+
+def variant_values(cls, stat, scales=SCALES):
+    """The values of STAT to try: its default times each of SCALES."""
+    default = default_stat(cls, stat)
+    values = []
+    for scale in scales:
+        value = default * scale
+        if stat != 'damage':
+            value = max(1 if stat == 'health' else 0, round(value))
+        if value not in values:
+            values.append(value)
+    return values
+
+
+def new_game(make_plan, tunnels, strategy, log, seed):
+    random.seed(seed)
+    return ants.GameState(strategy, ants.Hive(make_plan(ants)), probed_ant_types(log),
+                          ants.dry_layout, (tunnels, TUNNEL_LENGTH), START_FOOD)
+
+def play_out(gamestate, log):
+    """Plays GAMESTATE to the end, or to MAX_TURNS, and returns (won, turns)."""
+    while gamestate.outcome is None and gamestate.time < MAX_TURNS:
+        log.time = gamestate.time
+        gamestate.step()
+    return gamestate.outcome is True, gamestate.time + (gamestate.outcome is not None)
+
+def _fork_variants(gamestate, log, variants, workers):
+    """Plays each (key, value) of VARIANTS on from GAMESTATE in a forked
+    child, WORKERS at a time. A child that raises sends back its traceback,
+    which is raised again here.
+    """
+    results = []
+    state = random.getstate()  # random reseeds itself in a forked child
+    for start in range(0, len(variants), workers):
+        children = []
+        for key, value in variants[start:start + workers]:
+            read, write = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                os.close(read)
+                status = 0
+                try:
+                    random.setstate(state)
+                    log.overrides = {key: value}
+                    payload = json.dumps(play_out(gamestate, log))
+                except BaseException:
+                    payload, status = FAILED + traceback.format_exc(), 1
+                with os.fdopen(write, 'w') as f:
+                    f.write(payload)
+                os._exit(status)
+            os.close(write)
+            children.append((key, value, pid, read))
+        failure = None
+        for key, value, pid, read in children:  # Reap every child before raising
+            with os.fdopen(read) as f:
+                payload = f.read()
+            _, status = os.waitpid(pid, 0)
+            if failure is not None:
+                continue
+            if payload.startswith(FAILED):
+                failure = 'the {0} {1} = {2} variant failed in process {3}:\n{4}'.format(
+                    key[0], key[1], value, pid, payload[len(FAILED):])
+            elif not payload or status:
+                failure = 'the {0} {1} = {2} variant died in process {3} (status {4})'.format(
+                    key[0], key[1], value, pid, status)
+            else:
+                results.append(tuple(json.loads(payload)))
+        if failure is not None:
+            raise RuntimeError(failure)
+    return results
+
+def _copy_variants(gamestate, log, variants):
+    """Plays each (key, value) of VARIANTS on from a copy of GAMESTATE."""
+    results = []
+    saved = random.getstate()
+    for key, value in variants:
+        random.setstate(saved)
+        log.overrides = {key: value}
+        results.append(play_out(copy.deepcopy(gamestate), log))
+    log.overrides = {}
+    random.setstate(saved)
+    return results
+
+def sweep(make_plan, tunnels, strategy, seeds, variants, fork=None, workers=None):
+    """Plays every (ant name, stat, value) of VARIANTS on each of SEEDS.
+
+    Returns the result columns and the number of turns simulated.
+    """
+    fork = hasattr(os, 'fork') if fork is None else fork
+    workers = workers or os.cpu_count() or 1
+    columns = {name: [] for name in ('seed', 'ant', 'stat', 'value', 'won', 'turns', 'diverged')}
+    simulated = 0
+    def add(seed, key, value, result, diverged):
+        for name, item in zip(columns, (seed, key[0], key[1], value) + tuple(result) + (diverged,)):
+            columns[name].append(item)
+    for seed in seeds:
+        log = ReadLog()
+        baseline = play_out(new_game(make_plan, tunnels, strategy, log, seed), log)
+        simulated += baseline[1]
+        by_turn = {}
+        for name, stat, value in variants:
+            key = (name, stat)
+            if key not in log.first:
+                add(seed, key, value, baseline, -1)  # Never read, so never differs
+            else:
+                by_turn.setdefault(log.first[key], []).append((key, value))
+        log = ReadLog()
+        gamestate = new_game(make_plan, tunnels, strategy, log, seed)
+        for turn in sorted(by_turn):
+            while gamestate.time < turn:
+                log.time = gamestate.time
+                gamestate.step()
+                simulated += 1
+            group = by_turn[turn]
+            if fork:
+                results = _fork_variants(gamestate, log, group, workers)
+            else:
+                results = _copy_variants(gamestate, log, group)
+            for (key, value), result in zip(group, results):
+                add(seed, key, value, result, turn)
+                simulated += result[1] - turn
+    return {name: np.array(values) for name, values in columns.items()}, simulated
+
+def win_rates(columns):
+    """(ant, stat) -> [(value, win rate, mean divergence turn)], by value."""
+    table = {}
+    for ant in sorted(set(columns['ant'])):
+        for stat in STATS:
+            rows = (columns['ant'] == ant) & (columns['stat'] == stat)
+            if not rows.any():
+                continue
+            table[ant, stat] = [(value, columns['won'][rows & (columns['value'] == value)].mean(),
+                                 columns['diverged'][rows & (columns['value'] == value)].mean())
+                                for value in sorted(set(columns['value'][rows]))]
+    return table
+
+def plot(table, path):
+    """Draws win rate against each stat into PATH, if matplotlib is installed."""
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except Exception as e:
+        print('Could not load matplotlib: ' + str(e))
+        return False
+    figure, axes = plt.subplots(1, len(STATS), figsize=(5 * len(STATS), 4), squeeze=False)
+    for axis, stat in zip(axes[0], STATS):
+        for (ant, s), rows in table.items():
+            if s == stat:
+                axis.plot([r[0] for r in rows], [r[1] for r in rows], marker='o', label=ant)
+        axis.set_xlabel(stat)
+        axis.set_ylabel('win rate')
+        axis.set_ylim(-0.05, 1.05)
+        axis.legend()
+    figure.tight_layout()
+    figure.savefig(path)
+    return True
+
+@main
+def run(*args):
+    import argparse, time
+    parser = argparse.ArgumentParser(description='Ant stat sweeps for Ants vs. SomeBees')
+    parser.add_argument('--ants', default='Thrower,Short,Long,Harvester',
+                        help='comma-separated ant type names')
+    parser.add_argument('--stats', default=','.join(STATS), help='comma-separated stats')
+    parser.add_argument('--scales', default=','.join(map(str, SCALES)),
+                        help='multiples of each default value to try')
+    parser.add_argument('--seeds', type=int, default=20)
+    parser.add_argument('-d', dest='plan', default='normal', choices=list(PLANS))
+    parser.add_argument('--strategy', default='harvester-thrower', choices=list(STRATEGIES))
+    parser.add_argument('--no-fork', action='store_true', help='copy games in-process instead')
+    parser.add_argument('--workers', type=int, help='children at a time (default: one per core)')
+    parser.add_argument('--out', default='sweep.npz', help='results columns')
+    parser.add_argument('--plot', default='sweep.png', help='win rate plot')
+    args = parser.parse_args()
+    make_plan, tunnels = PLANS[args.plan]
+    classes = {cls.name: cls for cls in ants.ant_types()}
+    scales = [float(scale) for scale in args.scales.split(',')]
+    variants = [(name, stat, value) for name in args.ants.split(',')
+                for stat in args.stats.split(',')
+                if stat != 'damage' or classes[name].damage
+                for value in variant_values(classes[name], stat, scales)]
+    start = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        columns, simulated = sweep(make_plan, tunnels, STRATEGIES[args.strategy],
+                                   range(args.seeds), variants,
+                                   False if args.no_fork else None, args.workers)
+    unshared = int(columns['turns'].sum())
+    print('{0} games in {1:.1f}s; simulated {2} turns instead of {3}'.format(
+        len(columns['won']), time.time() - start, simulated, unshared))
+    np.savez(args.out, **columns)
+    table = win_rates(columns)
+    for (ant, stat), rows in table.items():
+        print('{0:<10} {1:<10} '.format(ant, stat) + '  '.join(
+            '{0:g}:{1:.2f}'.format(value, rate) for value, rate, _ in rows))
+    if plot(table, args.plot):
+        print('Plot saved to ' + args.plot)
@@ -1,10 +1,107 @@
 
+import sys
+import time
 from utils import *
 from ants import *
 from ants_strategies import start_with_strategy
 import ants
+
+CELL_WIDTH = 6
+HEADER_LINES = 2
+ANT_SYMBOLS = {'Harvester': 'H', 'Thrower': 'T', 'Short': 'S', 'Long': 'L',
+               'Fire': 'F', 'Wall': 'W', 'Hungry': 'G', 'Bodyguard': 'B',
+               'Tank': 'K', 'Scuba': 'U', 'Queen': 'Q'}
+
+class TextBoard:
+    """Draws the tunnels as a grid in a terminal, one row per tunnel.
+
+    Each frame only rewrites the cells whose text changed, using cursor
+    addressing, and goes out in a single write. Use strategy as a GameState
+    strategy; it wraps an optional STRATEGY that makes the deployments.
+    """
+
+    def __init__(self, strategy=None, out=sys.stdout, delay=0):
+        self.inner = strategy
+        self.out = out
+        self.delay = delay
+        self.coords = None  # place name -> (line, column) on screen
+        self.cells = {}     # (line, column) -> text on screen
+        self.versions = {}  # place name -> Place.version last drawn
+        self.gamestate = None
+
+    def strategy(self, gamestate):
+        self.gamestate = gamestate
+        if self.inner:
+            self.inner(gamestate)
+        self.draw(gamestate)
+        if self.delay:
+            time.sleep(self.delay)
+
+    def _layout(self, gamestate):
+        self.coords = {}
+        row, col = -1, 0
+        for name, place in gamestate.places.items():
+            if place.is_hive:
+                continue
+            if place.exit.name == 'Ant Home Base':
+                row, col = row + 1, 0
+            self.coords[name] = (HEADER_LINES + row + 1, col * CELL_WIDTH + 1)
+            col += 1
+        self.bottom = HEADER_LINES + row + 2
+
+    def cell_text(self, place):
+        ant = place.ant
+        if ant is None:
+            code = '~~' if isinstance(place, Water) else '. '
+        else:
+            code = ANT_SYMBOLS.get(ant.name, ant.name[0])
+            contained = getattr(ant, 'ant_contained', None)
+            code += ANT_SYMBOLS.get(contained.name, contained.name[0]) if contained else ' '
+        bees = '{0}b'.format(min(len(place.bees), 99)) if place.bees else ''
+        return '{0}{1:>3} '.format(code, bees)
+
+    def draw(self, gamestate):
+        """Writes the cells that changed since the previous frame."""
+        writes = []
+        if self.coords is None:
+            self._layout(gamestate)
+            writes.append('\x1b[2J\x1b[?25l')
+        header = 'Food: {0:<5} Time: {1:<5} Hive: {2:<4} bees'.format(
+            gamestate.food, gamestate.time, len(gamestate.beehive.bees))
+        self._put(writes, (1, 1), header)
+        for name, (line, col) in self.coords.items():
+            place = gamestate.places[name]
+            if self.versions.get(name) != place.version:
+                self.versions[name] = place.version
+                self._put(writes, (line, col), self.cell_text(place))
+        if writes:
+            writes.append('\x1b[{0};1H'.format(self.bottom))
+            self.out.write(''.join(writes))
+            self.out.flush()
+
+    def _put(self, writes, pos, text):
+        if self.cells.get(pos) != text:
+            self.cells[pos] = text
+            writes.append('\x1b[{0};{1}H{2}'.format(pos[0], pos[1], text))
+
+    def finish(self, gamestate):
+        """Draws the final board and restores the cursor."""
+        if gamestate is not None and self.coords is not None:
+            self.draw(gamestate)
+            self.out.write('\x1b[?25h\n')
+            self.out.flush()
+
 @main
 def run(*args):
+    if '--watch' in sys.argv:
+        # Headless board view: no prompt and no per-insect log lines
+        sys.argv.remove('--watch')
+        board = TextBoard()
+        try:
+            start_with_strategy(args, board.strategy, ants)
+        finally:
+            board.finish(board.gamestate)
+        return
     Insect.reduce_health = class_method_wrapper(Insect.reduce_health,
             pre=print_expired_insects)
     start_with_strategy(args, interactive_strategy, ants)
@@ -0,0 +1,159 @@
+"""Plays every strategy against every assault plan on the same seeds.
+
+Games run in parallel across cores, and each result is appended to a JSON
+lines file as soon as it finishes. Running again with the same file skips
+the games already there, so an interrupted tournament resumes where it
+stopped. The report gives each strategy's win rate, mean turns survived
+and food efficiency (damage dealt per food spent) with bootstrap
+confidence intervals. It also gives the paired difference in win rate
+from a baseline strategy over the seeds both played.
+"""
+
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import ants
+from ucb import main
+from ants_plans import PLANS
+from ants_strategies import STRATEGIES
+
+TUNNEL_LENGTH = 10
+START_FOOD = 2
+MAX_TURNS = 500  # Games still going after this many turns count as losses
+BOOTSTRAP_SAMPLES = 1000
+CONFIDENCE = 0.95
+
+def play_game(job):
+    """Plays the (strategy name, plan name, seed) JOB and returns its result."""
+    strategy_name, plan_name, seed = job
+    make_plan, tunnels = PLANS[plan_name]
+    strategy = STRATEGIES[strategy_name]
+    spent = [0]
+    def counting_strategy(gamestate):
+        food = gamestate.food
+        strategy(gamestate)
+        spent[0] += max(food - gamestate.food, 0)
+    random.seed(seed)
+    gamestate = ants.GameState(counting_strategy, ants.Hive(make_plan(ants)), ants.ant_types(),
+                               ants.dry_layout, (tunnels, TUNNEL_LENGTH), START_FOOD)
+    damage = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for record in gamestate.turns():
+            damage += record.damage_dealt
+            if record.time + 1 >= MAX_TURNS:
+                break
+    return {'strategy': strategy_name, 'plan': plan_name, 'seed': seed,
+            'won': gamestate.outcome is True, 'turns': record.time + 1,
+            'food_spent': spent[0], 'damage': damage}
+
+def food_efficiency(result):
+    return result['damage'] / result['food_spent'] if result['food_spent'] else 0.0
+
+def load_results(path):
+    """Reads the results in PATH, keyed by (strategy, plan, seed). A line cut
+    short by a crash is ignored.
+    """
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            results[result['strategy'], result['plan'], result['seed']] = result
+    return results
+
+def run_tournament(strategies, plans, seeds, path, workers=None):
+    """Plays the games missing from PATH, appending each result as it
+    arrives. Returns all results, keyed as in load_results.
+    """
+    results = load_results(path)
+    jobs = [(strategy, plan, seed) for plan in plans for strategy in strategies
+            for seed in seeds if (strategy, plan, seed) not in results]
+    if not jobs:
+        return results
+    with open(path, 'a+') as out:
+        out.seek(0, os.SEEK_END)
+        if out.tell():
+            out.seek(out.tell() - 1)
+            if out.read(1) != '\n':
+                out.write('\n')  # Finish a line cut short by a crash
+        with multiprocessing.Pool(workers) as pool:
+            for i, result in enumerate(pool.imap_unordered(play_game, jobs, chunksize=4)):
+                out.write(json.dumps(result) + '\n')
+                out.flush()
+                results[result['strategy'], result['plan'], result['seed']] = result
+                if (i + 1) % 100 == 0 or i + 1 == len(jobs):
+                    print('{0}/{1} games'.format(i + 1, len(jobs)), flush=True)
+    return results
+
+def mean(values):
+    return sum(values) / len(values)
+
+def bootstrap(values, statistic=mean, samples=BOOTSTRAP_SAMPLES, seed=0):
+    """A CONFIDENCE interval for STATISTIC of VALUES by the percentile bootstrap."""
+    rng = random.Random(seed)
+    n = len(values)
+    stats = sorted(statistic([values[rng.randrange(n)] for _ in range(n)])
+                   for _ in range(samples))
+    tail = (1 - CONFIDENCE) / 2
+    return stats[int(tail * samples)], stats[int((1 - tail) * samples) - 1]
+
+def report(results, strategies, plans, seeds, baseline=None):
+    """Prints one table per plan over the games of SEEDS alone, so a resumed
+    results file with other seeds does not change the comparison; returns
+    its rows as dicts.
+    """
+    baseline = baseline or strategies[0]
+    seeds = set(seeds)
+    results = {(s, p, seed): r for (s, p, seed), r in results.items()
+               if s in strategies and p in plans and seed in seeds}
+    rows = []
+    for plan in plans:
+        print('\n{0}'.format(plan))
+        print('{0:<20} {1:>5} {2:>21} {3:>21} {4:>21} {5:>21}'.format(
+            'strategy', 'games', 'win rate', 'turns', 'food efficiency',
+            'win rate - ' + baseline))
+        base = {seed: r['won'] for (s, p, seed), r in results.items()
+                if s == baseline and p == plan}
+        for strategy in strategies:
+            games = sorted((r for (s, p, _), r in results.items() if s == strategy and p == plan),
+                           key=lambda r: r['seed'])
+            if not games:
+                continue
+            row = {'plan': plan, 'strategy': strategy, 'games': len(games)}
+            for key, values in (('win_rate', [float(r['won']) for r in games]),
+                                ('turns', [r['turns'] for r in games]),
+                                ('food_efficiency', [food_efficiency(r) for r in games])):
+                row[key] = (mean(values),) + bootstrap(values)
+            paired = [r['won'] - base[r['seed']] for r in games if r['seed'] in base]
+            row['win_rate_diff'] = (mean(paired),) + bootstrap(paired) if paired else None
+            rows.append(row)
+            cells = [row[key] for key in ('win_rate', 'turns', 'food_efficiency', 'win_rate_diff')]
+            print('{0:<20} {1:>5} '.format(strategy, len(games)) + ' '.join(
+                '{0:>21}'.format('{0:.2f} [{1:.2f}, {2:.2f}]'.format(*cell) if cell else '-')
+                for cell in cells))
+    return rows
+
+@main
+def run(*args):
+    import argparse
+    parser = argparse.ArgumentParser(description='Strategy tournament for Ants vs. SomeBees')
+    parser.add_argument('--seeds', type=int, default=100, help='games per strategy and plan')
+    parser.add_argument('--strategies', default=','.join(STRATEGIES),
+                        help='comma-separated names from ants_strategies.STRATEGIES')
+    parser.add_argument('--plans', default=','.join(PLANS),
+                        help='comma-separated names from ants_plans.PLANS')
+    parser.add_argument('--baseline', help='strategy to compare the others with')
+    parser.add_argument('--out', default='tournament.jsonl', help='results file (resumed if present)')
+    parser.add_argument('--workers', type=int, help='processes (default: one per core)')
+    args = parser.parse_args()
+    strategies, plans = args.strategies.split(','), args.plans.split(',')
+    seeds = range(args.seeds)
+    results = run_tournament(strategies, plans, seeds, args.out, args.workers)
+    report(results, strategies, plans, seeds, args.baseline)
@@ -2,6 +2,7 @@
 
 import sys
 import math
+import time
 
 try:
     import tkinter
@@ -31,6 +32,8 @@ class Canvas:
         self._tk.title(title or 'Graphics Window')
         self._tk.bind('<Button-1>', self._click)
         self._click_pos = None
+        self._click_handler = None
+        self._wake = tkinter.BooleanVar(master=self._tk)
 
         # Canvas object
         self._canvas = tkinter.Canvas(self._tk, width=width, height=height)
@@ -39,12 +42,46 @@ class Canvas:
         self._canvas.update()
         self._images = dict()
 
+        # Frame scheduler: shape id -> (points_fn, start time, max frames)
+        self._animations = dict()
+        self._frame_pending = False
+
     def clear(self, shape='all'):
         self._canvas.delete(shape)
         if shape == 'all':
+            self._animations.clear()
             self._draw_background()
+        else:
+            self._animations.pop(shape, None)
         self._canvas.update()
 
+    def delete(self, *shapes):
+        """Deletes SHAPES without forcing a redraw, unlike clear."""
+        for shape in shapes:
+            self._animations.pop(shape, None)
+        self._canvas.delete(*shapes)
+
+    def move(self, tag, dx, dy):
+        """Moves every shape tagged TAG by (DX, DY), including where their
+        running animations will take them.
+        """
+        self._canvas.move(tag, dx, dy)
+        for id, (points_fn, start, max_frames) in list(self._animations.items()):
+            if tag in self._canvas.gettags(id):
+                moved = lambda n, fn=points_fn: [shift_point(p, (dx, dy)) for p in fn(n)]
+                self._animations[id] = (moved, start, max_frames)
+
+    def lower_to_background(self, *shapes):
+        """Stacks SHAPES, in order, just above the background and below
+        every other shape.
+        """
+        for shape in reversed(shapes):
+            self._canvas.tag_raise(shape, self._background)
+
+    def bind(self, sequence, fn):
+        """Calls FN with the Tk event for every SEQUENCE event (e.g. '<Left>')."""
+        self._tk.bind(sequence, fn)
+
     def draw_polygon(self, points, color='Black', fill_color=None, filled=1, smooth=0, width=1):
         if fill_color == None:
             fill_color = color
@@ -100,13 +137,36 @@ class Canvas:
             self._canvas.itemconfigure(id, font=(font, str(size), style))
 
     def animate_shape(self, id, duration, points_fn, frame_count=0):
+        """Animates shape ID by calling POINTS_FN with each frame number.
+
+        All animations are advanced together by a single scheduled callback.
+        A new animation of the same shape replaces the old one, and frames are
+        skipped rather than queued when the scheduler falls behind.
+        """
         max_frames = duration // FRAME_TIME
-        points = points_fn(frame_count)
-        self._canvas.coords(id, flattened(points))
-        if frame_count < max_frames:
-            def tail():
-                self.animate_shape(id, duration, points_fn, frame_count + 1)
-            self._tk.after(int(FRAME_TIME * 1000), tail)
+        start = time.monotonic() - frame_count * FRAME_TIME
+        self._animations[id] = (points_fn, start, max_frames)
+        self._canvas.coords(id, flattened(points_fn(frame_count)))
+        self._schedule_frame()
+
+    def cancel_animation(self, id):
+        self._animations.pop(id, None)
+
+    def _schedule_frame(self, delay=FRAME_TIME):
+        if not self._frame_pending and self._animations:
+            self._frame_pending = True
+            self._tk.after(max(1, int(delay * 1000)), self._advance_frame)
+
+    def _advance_frame(self):
+        """Moves every active animation to the frame matching the current time."""
+        self._frame_pending = False
+        now = time.monotonic()
+        for id, (points_fn, start, max_frames) in list(self._animations.items()):
+            frame_count = min(int((now - start) / FRAME_TIME), max_frames)
+            self._canvas.coords(id, flattened(points_fn(frame_count)))
+            if frame_count >= max_frames:
+                del self._animations[id]
+        self._schedule_frame(FRAME_TIME - (time.monotonic() - now))
 
     def slide_shape(self, id, end_pos, duration, elapsed=0):
         points = paired(self._canvas.coords(id))
@@ -119,28 +179,54 @@ class Canvas:
         self.animate_shape(id, duration, points_fn)
 
     def wait_for_click(self, seconds=0):
-        elapsed = 0
-        while elapsed < seconds or seconds == 0:
-            if self._click_pos is not None:
-                pos = self._click_pos
-                self._click_pos = None
-                return pos, elapsed
-            self._sleep(FRAME_TIME)
-            elapsed += FRAME_TIME
-        return None, elapsed
+        """Waits for a click for at most SECONDS (forever if 0) without polling.
+
+        Returns the click position (or None) and the seconds elapsed.
+        """
+        start = time.monotonic()
+        if self._click_pos is None:
+            timer = None
+            if seconds > 0:
+                timer = self._tk.after(max(1, int(1000 * seconds)), self._wake.set, True)
+            self._tk.wait_variable(self._wake)
+            if timer is not None:
+                self._tk.after_cancel(timer)
+        pos, self._click_pos = self._click_pos, None
+        return pos, time.monotonic() - start
+
+    def on_click(self, handler):
+        """Calls HANDLER with the position of every click, as it happens.
+
+        Passing None restores buffering clicks for wait_for_click.
+        """
+        self._click_handler = handler
+
+    def after(self, seconds, fn, *args):
+        """Schedules FN(*ARGS) on the event loop in SECONDS."""
+        return self._tk.after(max(1, int(1000 * seconds)), fn, *args)
+
+    def cancel(self, timer):
+        self._tk.after_cancel(timer)
+
+    def mainloop(self):
+        """Runs the event loop until quit is called."""
+        self._tk.mainloop()
+
+    def quit(self):
+        self._tk.quit()
 
     def _draw_background(self):
         w, h = self.width - 1, self.height - 1
         corners = [(0,0), (0, h), (w, h), (w, 0)]
-        self.draw_polygon(corners, self.color, fill_color=self.color, filled=True, smooth=False)
+        self._background = self.draw_polygon(corners, self.color, fill_color=self.color,
+                                             filled=True, smooth=False)
 
     def _click(self, event):
-        self._click_pos = (event.x, event.y)
-
-    def _sleep(self, seconds):
-        self._tk.update_idletasks()
-        self._tk.after(int(1000 * seconds), self._tk.quit)
-        self._tk.mainloop()
+        if self._click_handler is not None:
+            self._click_handler((event.x, event.y))
+        else:
+            self._click_pos = (event.x, event.y)
+            self._wake.set(True)
 
 def flattened(points):
     coords = list()
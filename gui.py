@@ -10,13 +10,18 @@ import shutil
 import zipfile
 import threading
 import importlib
-from time import sleep
+import math
+from collections import deque
+from time import monotonic
 from ucb import *
 
 VERSION = 1.2
 ASSETS_DIR = "assets/"
 INSECT_DIR = "insects/"
 STRATEGY_SECONDS = 3
+TICK_SECONDS = 0.25  # Control panel refresh interval while waiting on a turn
+FAST_FORWARD_FRAME_SECONDS = 0.25  # Frame sampling interval in fast-forward
+DEAD_HISTORY_SIZE = 200  # Death events kept for clients that poll slowly
 INSECT_FILES = {
        'Worker': ASSETS_DIR + INSECT_DIR +  "ant_harvester.gif",
        'Thrower': ASSETS_DIR + INSECT_DIR +  "ant_thrower.gif",
@@ -37,11 +42,24 @@ INSECT_FILES = {
        'Bee': ASSETS_DIR + INSECT_DIR +  "bee.gif",
        'Remover': ASSETS_DIR + INSECT_DIR + "remove.png",
 }
+ATLAS_FILE = ASSETS_DIR + "insects_atlas.json"
+GZIP_TYPES = ('text/html', 'text/css', 'application/javascript', 'text/javascript', 'application/json')
+GZIP_MIN_BYTES = 512
+GZIP_CACHE_SIZE = 64  # Compressed files kept in memory
+
+class BadRequest(Exception):
+    """A request the server cannot act on; answered with a 400 and its message."""
 
 class GUI:
 
     def __init__(self):
         self.active = True
+        self.strategySeconds = STRATEGY_SECONDS
+        self.fastForward = False
+        # Deployments from HTTP threads wait here for the game thread to apply
+        # them, so they never interleave with ant and bee actions.
+        self.operations = deque()  # (apply, data, done Event, [result])
+        self.operationsReady = threading.Condition()
         self.cleanState()
 
     def cleanState(self):
@@ -49,15 +67,19 @@ class GUI:
         self.state = state.State()
         self.gameOver = False
         self.gamestate = None
+        self.lastFrame = 0
         self.currentBeeId = 0
         self.currentInsectId = 0
-        self.insects = []
-        self.bees = []
-        self.deadbees = []
-        self.deadinsects = []
+        self.insects = set()
+        self.bees = set()
+        self.deathSeq = 0
+        self.deathLock = threading.Lock()
+        self.deaths = deque()  # The latest (seq, "bee" or "insect", id) events
+        self.deathsEvicted = 0  # seq of the newest event dropped from deaths
         self.insectToId = {}
         self.beeToId = {}
         self.beeLocations = {}
+        self.placeVersions = {}  # place name -> Place.version last rendered
 
     def makeHooks(self):
         ants.Insect.death_callback = dead_insect
@@ -70,7 +92,16 @@ class GUI:
         self.makeHooks()
 
         self.winner = ants_strategies.start_with_strategy(gui.args, gui.strategy, ants)
-        self.gameOver = True
+        with self.operationsReady:
+            self.gameOver = True
+            for _, _, done, result in self.operations:
+                result.append({ "error": "The game is over" })
+                done.set()
+            self.operations.clear()
+        if self.initialized:
+            # Fast-forward may have skipped the final frames
+            self.saveState("time", self.gamestate.time)
+            self._update_control_panel(self.gamestate)
         self.saveState("winner", self.winner)
         self.saveState("gameOver", self.gameOver)
         update()
@@ -88,8 +119,10 @@ class GUI:
     def initialize_colony_graphics(self, gamestate):
         self.gamestate = gamestate
         self.ant_type_selected = -1
-        self.saveState("strategyTime", STRATEGY_SECONDS)
+        self.saveState("strategyTime", self.strategySeconds)
+        self.saveState("fastForward", self.fastForward)
         self.saveState("food", self.gamestate.food)
+        self.saveState("atlas", ATLAS_FILE)
         self.ant_types = self.get_ant_types()
         self._init_places(gamestate)
         self.saveState("places", self.places)
@@ -110,7 +143,40 @@ class GUI:
         return INSECT_FILES[name]
 
     def getState(self, data=None):
-        return self.state.getState()
+        """The state, with the death events this client has not seen yet.
+
+        Clients send the last deathSeq they processed as "ack" with each poll
+        and get only later events. "resync" is set when some of those events
+        have already left the history; the client should then rebuild its
+        sprites from "places" and "beeLocations".
+        """
+        cursor = None
+        if data and "ack" in data:
+            try:
+                cursor = int(data["ack"])
+            except (TypeError, ValueError):
+                raise BadRequest("ack must be the integer deathSeq last processed")
+        response = dict(self.state.getState())
+        with self.deathLock:
+            events = [event for event in self.deaths if cursor is None or event[0] > cursor]
+            response["resync"] = cursor is not None and \
+                not self.deathsEvicted <= cursor <= self.deathSeq
+            response["deathSeq"] = self.deathSeq
+            response["beeLocations"] = dict(self.beeLocations)  # Consistent with the events
+        response["deadbees"] = [id for _, kind, id in events if kind == "bee"]
+        response["deadinsects"] = [id for _, kind, id in events if kind == "insect"]
+        return response
+
+    def recordDeath(self, kind, id):
+        """Appends a death event, evicting the oldest once the history is full."""
+        with self.deathLock:
+            if len(self.deaths) >= DEAD_HISTORY_SIZE:
+                seq, old_kind, old_id = self.deaths.popleft()
+                self.deathsEvicted = seq
+                if old_kind == "bee":
+                    self.beeLocations.pop(old_id, None)
+            self.deathSeq += 1
+            self.deaths.append((self.deathSeq, kind, id))
 
     def saveState(self, key, val):
         self.state.updateState(key, val)
@@ -118,13 +184,74 @@ class GUI:
     def strategy(self, gamestate):
         if not self.initialized:
             self.initialize_colony_graphics(gamestate)
-        elapsed = 0 
-        self.saveState("time", int(elapsed))
-        while elapsed < STRATEGY_SECONDS:
+        if self.fastForward:
+            # Run the turn immediately; only publish a frame every so often
+            self._applyOperations()
+            now = monotonic()
+            if now - self.lastFrame >= FAST_FORWARD_FRAME_SECONDS:
+                self.lastFrame = now
+                self.saveState("time", gamestate.time)
+                self._update_control_panel(gamestate)
+            return
+        start = monotonic()
+        while True:
+            # Every deployment queued before the turn ends is applied, even
+            # with no time between turns
+            self._applyOperations()
             self.saveState("time", gamestate.time)
             self._update_control_panel(gamestate)
-            sleep(0.25)
-            elapsed += 0.25
+            remaining = start + self.strategySeconds - monotonic()
+            if remaining <= 0 or self.fastForward:
+                return
+            with self.operationsReady:
+                self.operationsReady.wait_for(lambda: self.operations,
+                                              min(TICK_SECONDS, remaining))
+
+    def _submit(self, apply, data):
+        """Queues APPLY(DATA) for the game thread and returns its result."""
+        done, result = threading.Event(), []
+        with self.operationsReady:
+            if not self.initialized:
+                return { "error": "The game has not started" }
+            if self.gameOver:
+                return { "error": "The game is over" }
+            self.operations.append((apply, data, done, result))
+            self.operationsReady.notify()
+        done.wait()
+        return result[0]
+
+    def _applyOperations(self):
+        """Applies the queued operations on the game thread, in order."""
+        applied = False
+        while self.operations:
+            with self.operationsReady:
+                apply, data, done, result = self.operations.popleft()
+            try:
+                result.append(apply(data))
+            except Exception as e:
+                result.append({ "error": str(e) or type(e).__name__ })
+            applied = True
+            done.set()
+        if applied:
+            self._update_control_panel(self.gamestate)
+
+    def setSpeed(self, data):
+        """Changes the seconds per turn and/or toggles fast-forward mid-game."""
+        try:
+            if "seconds" in data:
+                seconds = float(data["seconds"])
+                if seconds < 0:
+                    return { "error": "Seconds per turn must be non-negative" }
+                if not math.isfinite(seconds):
+                    return { "error": "Seconds per turn must be finite" }
+                self.strategySeconds = seconds
+            if "fastForward" in data:
+                self.fastForward = str(data["fastForward"]).lower() in ("1", "true")
+        except ValueError as e:
+            return { "error": str(e) or type(e).__name__ }
+        self.saveState("strategyTime", self.strategySeconds)
+        self.saveState("fastForward", self.fastForward)
+        return { "success": 1, "strategyTime": self.strategySeconds, "fastForward": self.fastForward }
 
     def get_place_row(self, name):
         return name.split("_")[1]
@@ -134,6 +261,7 @@ class GUI:
 
     def _init_places(self, gamestate):
         self.places = {};
+        self.place_coords = {}
         self.images = { 'AntQueen': dict() }
         rows = 0
         cols = 0
@@ -147,6 +275,7 @@ class GUI:
             if not pRow in self.places:
                 self.places[pRow] = {}
             self.places[pRow][pCol] = { "name": name, "type": "tunnel", "water": 0, "insects": {} }
+            self.place_coords[name] = (pRow, pCol)
             if "water" in name:
                 self.places[pRow][pCol]["water"] = 1
             self.images[name] = dict()
@@ -164,74 +293,236 @@ class GUI:
         self.saveState("food", self.gamestate.food)
 
     def _update_control_panel(self, gamestate):
+        """Re-renders the cells of places whose contents changed since the last call."""
         self.update_food()
-        old_insects = self.insects[:]
-        old_bees = self.bees[:]
-        self.bees, self.insects = [], []
+        changed = False
         for name, place in gamestate.places.items():
-            if place.name == 'Hive':
+            if place.name == 'Hive' or self.placeVersions.get(name) == place.version:
                 continue
-            pCol = self.get_place_column(name)
-            pRow = self.get_place_row(name)
+            self.placeVersions[name] = place.version
+            changed = True
+            pRow, pCol = self.place_coords[name]
+            cell = self.places[pRow][pCol]
+            old_id = cell["insects"].get("id")
+            if old_id is not None:
+                self.insects.discard(old_id)
             if place.ant is not None:
-                if self.insectToId[place.ant] not in self.insects:
-                    self.insects.append(self.insectToId[place.ant])
-                self.places[pRow][pCol]["insects"] = {
+                self.insects.add(self.insectToId[place.ant])
+                cell["insects"] = {
                         "id": self.insectToId[place.ant],
                         "type": place.ant.name,
                         "img": self.get_insect_img_file(place.ant.name)
                         }
-                if place.ant is not None:
-                    ant_container = isinstance(place.ant, ants.ContainerAnt)
-                    self.places[pRow][pCol]["insects"]["container"] = ant_container
-                    if ant_container and place.ant.ant_contained:
-                        self.places[pRow][pCol]["insects"]["contains"] = {
-                                "type": place.ant.ant_contained.name,
-                                "img": self.get_insect_img_file(place.ant.ant_contained.name)
-                                }
+                ant_container = isinstance(place.ant, ants.ContainerAnt)
+                cell["insects"]["container"] = ant_container
+                if ant_container and place.ant.ant_contained:
+                    cell["insects"]["contains"] = {
+                            "type": place.ant.ant_contained.name,
+                            "img": self.get_insect_img_file(place.ant.ant_contained.name)
+                            }
             else:
-                self.places[pRow][pCol]["insects"] = {}
+                cell["insects"] = {}
             for bee in place.bees:
                 self.beeLocations[self.beeToId[bee]] = name
-                if self.beeToId[bee] not in self.bees:
-                    self.bees.append(self.beeToId[bee])
-        self.saveState("beeLocations", self.beeLocations)
+                self.bees.add(self.beeToId[bee])
+        if changed:
+            self.saveState("beeLocations", self.beeLocations)
 
     def deployAnt(self, data):
-        pname, ant = data["pname"], data["ant"]
-        if ant == "Remover":
-            existing_ant = self.gamestate.places[pname].ant
-            if existing_ant is not None:
-                print("gamestate.remove_ant('{0}')".format(pname))
-                self.gamestate.remove_ant(pname)
+        self._checkOperation(data)
+        result = self._submit(lambda op: self._applyOperation(op, []), data)
+        if data.get("ant") == "Remover":
             return
+        return result
+
+    def deployBatch(self, data):
+        """Applies a list of deploy/remove operations as a single unit.
+
+        DATA is {"operations": [{"pname": ..., "ant": ...}, ...]}, where an ant
+        of "Remover" removes the ant at pname. If any operation fails, the ones
+        before it are rolled back and the rest are skipped.
+        """
+        operations = data.get("operations", [])
+        if not isinstance(operations, list):
+            raise BadRequest('"operations" must be a list of objects')
+        for op in operations:
+            self._checkOperation(op)
+        return self._submit(self._applyBatch, operations)
+
+    @staticmethod
+    def _checkOperation(op):
+        if not isinstance(op, dict):
+            raise BadRequest('Each operation must be an object with "pname" and "ant"')
+        for key in ("pname", "ant"):
+            if not isinstance(op.get(key), str):
+                raise BadRequest('"{0}" must be a string'.format(key))
+
+    def _applyBatch(self, operations):
+        results, undo = [], []
+        for op in operations:
+            result = self._applyOperation(op, undo)
+            results.append(result)
+            if "error" in result:
+                self._rollback(undo)
+                for earlier in results[:-1]:
+                    earlier["rolledBack"] = 1
+                results.extend({ "skipped": 1 } for _ in operations[len(results):])
+                break
+        success = all("success" in result for result in results)
+        return { "success": int(success), "results": results, "food": self.gamestate.food }
+
+    def _applyOperation(self, op, undo):
+        """Deploys or removes a single ant, recording how to revert it in UNDO."""
+        pname, ant = op.get("pname"), op.get("ant")
+        if pname not in self.gamestate.places:
+            return { "error": "Unknown place {0}".format(pname) }
+        place = self.gamestate.places[pname]
+        if ant == "Remover":
+            existing_ant = place.ant
+            if existing_ant is None:
+                return { "error": "No ant to remove at {0}".format(pname) }
+            print("gamestate.remove_ant('{0}')".format(pname))
+            self.gamestate.remove_ant(pname)
+            undo.append(("remove", place, existing_ant))
+            return { "success": 1 }
         insect = None
         try:
             print("gamestate.deploy_ant('{0}', '{1}')".format(pname, ant))
             insect = self.gamestate.deploy_ant(pname, ant);
         except Exception as e:
             print(e)
-            return { "error": str(e) }
+            return { "error": str(e) or type(e).__name__ }
         if not insect:
             return { "error" : "Unable to deploy ant" }
         id = self.currentInsectId
-        self.insects.append(id)
+        self.insects.add(id)
         self.insectToId[insect] = id
         self.currentInsectId += 1
-        self._update_control_panel(self.gamestate);
+        undo.append(("deploy", place, insect))
         return { "success": 1, "id": id }
 
+    def _rollback(self, undo):
+        """Reverts the operations recorded by _applyOperation, newest first."""
+        for kind, place, insect in reversed(undo):
+            if kind == "remove":
+                place.ant = insect
+                insect.place = place
+                place.version += 1
+            else:
+                if insect.place is place:
+                    place.remove_insect(insect)
+                self.gamestate.food += insect.food_cost
+                self.insects.discard(self.insectToId.pop(insect))
+        undo.clear()
+
 import http.server
 import cgi
+import gzip
+import io
+import email.utils
+import functools
+
+@functools.lru_cache(maxsize=GZIP_CACHE_SIZE)
+def gzip_file(path, mtime_ns):
+    """The gzipped contents of PATH. MTIME_NS is part of the key, so an
+    edited file is compressed again.
+    """
+    with open(path, 'rb') as f:
+        return gzip.compress(f.read())
+
+def accepts_gzip(accept_encoding):
+    """Whether an Accept-Encoding header allows gzip, honouring q-values:
+    "gzip;q=0" refuses it, and "*" stands for any coding not listed.
+    """
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[coding.lower()] = q
+    q = qualities.get('gzip', qualities.get('x-gzip', qualities.get('*', 0.0)))
+    return q > 0
+
 class HttpHandler(http.server.SimpleHTTPRequestHandler):
+
     def log_message(self, format, *args):
         return
+
+    def send_head(self):
+        """Serves static files with validators, 304s and gzip for text assets."""
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            return super().send_head()
+        st = os.stat(path)
+        etag = '"{0:x}-{1:x}"'.format(st.st_mtime_ns, st.st_size)
+        if self.not_modified(etag, st.st_mtime):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return None
+        ctype = self.guess_type(path)
+        with open(path, 'rb') as f:
+            body = f.read()
+        encoded = False
+        if ctype in GZIP_TYPES and len(body) >= GZIP_MIN_BYTES \
+                and accepts_gzip(self.headers.get('Accept-Encoding', '')):
+            body, encoded = gzip_file(path, st.st_mtime_ns), True
+        self.send_response(200)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', self.date_time_string(st.st_mtime))
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoded:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        return io.BytesIO(body)
+
+    def not_modified(self, etag, mtime):
+        if 'If-None-Match' in self.headers:
+            return etag in [t.strip() for t in self.headers['If-None-Match'].split(',')]
+        since = self.headers.get('If-Modified-Since')
+        if since:
+            try:
+                return int(mtime) <= email.utils.parsedate_to_datetime(since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
     def cgiFieldStorageToDict(self, fieldStorage):
         params = {}
         for key in fieldStorage.keys():
             params[key] = fieldStorage[key].value
         return params
 
+    def readBody(self):
+        """The POST body as a dict, from a JSON object or form fields."""
+        content_type = self.headers.get('Content-Type', '')
+        if not content_type.startswith('application/json'):
+            form = cgi.FieldStorage(
+                fp=self.rfile,
+                headers=self.headers,
+                environ={'REQUEST_METHOD':'POST',
+                 'CONTENT_TYPE':content_type,
+                })
+            return self.cgiFieldStorageToDict(form)
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            data = json.loads(self.rfile.read(length).decode('utf-8') or '{}')
+        except ValueError as e:
+            raise BadRequest("The body is not valid JSON: {0}".format(e))
+        if not isinstance(data, dict):
+            raise BadRequest("The body must be a JSON object")
+        return data
+
     def do_POST(self):
         path = self.path
         action = {
@@ -239,32 +530,62 @@ class HttpHandler(http.server.SimpleHTTPRequestHandler):
                 '/ajax/start/game': gui.startGame,
                 '/ajax/exit': gui.exit,
                 '/ajax/deploy/ant': gui.deployAnt,
+                '/ajax/deploy/batch': gui.deployBatch,
+                '/ajax/set/speed': gui.setSpeed,
                 }.get(path)
         if not action:
             return
-        form = cgi.FieldStorage(
-            fp=self.rfile,
-            headers=self.headers,
-            environ={'REQUEST_METHOD':'POST',
-             'CONTENT_TYPE':self.headers['Content-Type'],
-            })
-        data = self.cgiFieldStorageToDict(form)
-        response = action(data)
+        try:
+            response = action(self.readBody())
+        except BadRequest as e:
+            self.send_response(400)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({ "error": str(e) }).encode('ascii'))
+            return
         self.send_response(200)
         if response:
             self.send_header('Content-Type', 'application/json')
             self.end_headers()
             response = json.dumps(response)
             self.wfile.write(response.encode('ascii'))
+        else:
+            self.end_headers()
 
 def dead_insect(ant):
     print('{0} ran out of health and expired'.format(ant))
     if ant in gui.insectToId:
-        gui.deadinsects.append(gui.insectToId[ant])
-        gui.saveState("deadinsects", gui.deadinsects)
+        gui.insects.discard(gui.insectToId[ant])
+        gui.recordDeath("insect", gui.insectToId[ant])
     elif ant in gui.beeToId:
-        gui.deadbees.append(gui.beeToId[ant])
-        gui.saveState("deadbees", gui.deadbees)
+        gui.bees.discard(gui.beeToId[ant])
+        gui.recordDeath("bee", gui.beeToId[ant])
+
+def build_sprite_atlas(path=ATLAS_FILE):
+    """Bundles every insect image into one JSON file of data URIs.
+
+    The atlas is rebuilt only when one of the images is newer than it, so
+    clients can fetch (and cache) all sprites in a single request.
+    """
+    import base64, mimetypes
+    sources = [f for f in set(INSECT_FILES.values()) if os.path.isfile(f)]
+    if not sources:
+        print("No insect images found; skipping sprite atlas")
+        return
+    if os.path.isfile(path) and \
+            os.path.getmtime(path) >= max(os.path.getmtime(f) for f in sources):
+        return
+    sprites = {}
+    for name, image_file in INSECT_FILES.items():
+        if image_file not in sources:
+            continue
+        with open(image_file, 'rb') as f:
+            encoded = base64.b64encode(f.read()).decode('ascii')
+        mime = mimetypes.guess_type(image_file)[0] or 'application/octet-stream'
+        sprites[name] = {"file": image_file, "data": "data:{0};base64,{1}".format(mime, encoded)}
+    with open(path, 'w') as f:
+        json.dump({"sprites": sprites}, f)
+    print("Built sprite atlas", path)
 
 def update():
     request = urllib.request.Request("https://api.github.com/repos/colinschoen/Ants-Web-Viewer/releases/latest")
@@ -336,6 +657,7 @@ def run(*args):
     global gui
     gui = GUI()
     gui.args = args
+    build_sprite_atlas()
     #Basic HTTP Handler
     #Handler = http.server.SimpleHTTPRequestHandler
     for PORT in range(8000, 8100):